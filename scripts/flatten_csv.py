@@ -1,47 +1,94 @@
-import os
+import argparse
 import csv
-from collections import defaultdict
+import shutil
+import sys
+import tempfile
 
-with open(r"C:\Users\dev\Downloads\great_lakes_digital_library-xml (1).csv") as f:
-	data = defaultdict(lambda: defaultdict(list))
-	last_id = ''
 
-	reader = csv.DictReader(f)
+def flatten_csv(input_filename, output_filename, id_column="identifier"):
+	with open(input_filename, newline="") as f_in:
+		with open(output_filename, mode="w", newline="") as f_out:
+			flatten_file(f_in, f_out, id_column)
+
+
+def flatten_file(f_in, f_out, id_column="identifier"):
+	# Two streaming passes: the first only keeps the widest value count seen
+	# for each column, the second writes one row per record. Input that
+	# can't be rewound (e.g. stdin) is spilled to a temp file first.
+	if not f_in.seekable():
+		spill = tempfile.TemporaryFile(mode="w+", newline="")
+		shutil.copyfileobj(f_in, spill)
+		f_in = spill
+
+	f_in.seek(0)
+	fieldnames, widths = count_widths(csv.DictReader(f_in), id_column)
+
+	f_in.seek(0)
+	writer = csv.writer(f_out)
+	writer.writerow(make_header(fieldnames, widths))
+	for group in iter_groups(csv.DictReader(f_in), id_column):
+		writer.writerow(flatten_group(group, fieldnames, widths))
+
+
+def iter_groups(reader, id_column):
+	# ContentDM exports a compound record as one row carrying the identifier
+	# followed by continuation rows with an empty identifier.
+	group = []
+	last_id = ""
 	for row in reader:
-		last_id = row['identifier'] if row['identifier'] else last_id
-		for key, value in row.items():
-			data[last_id][key].append(value)
-
-	keys = data[last_id].keys()
-	max_lengths = []
-	for key in keys:
-
-		lengths = []
-		for sub_dict in data.values():
-			length = len(list(filter(None, sub_dict[key]))) if sub_dict[key] else 0
-			lengths.append(length)
-
-		max_lengths.append(max(lengths))
-
-	lengths = dict(zip(keys, max_lengths))
-	
-	with open("great_lakes_digital_library_flattened.csv", mode="w", newline="") as f:
-		writer = csv.writer(f)
-		header = []
-		for key in keys:
-			for i in range(1, lengths[key] + 1):
-				header.append("{0} {1}".format(key, i))
-
-		writer.writerow(header)
-
-		for sub_dict in data.values():
-			row = []
-
-			for key in keys:
-				for i in range(lengths[key]):
-					if i < len(sub_dict[key]):
-						row.append(sub_dict[key][i])
-					else:
-						row.append("")
-
-			writer.writerow(row)
+		if row[id_column] and row[id_column] != last_id:
+			if group:
+				yield group
+			group = []
+			last_id = row[id_column]
+		group.append(row)
+	if group:
+		yield group
+
+
+def count_widths(reader, id_column):
+	widths = dict((key, 0) for key in reader.fieldnames or [])
+	for group in iter_groups(reader, id_column):
+		for key in widths:
+			length = len([row[key] for row in group if row[key]])
+			if length > widths[key]:
+				widths[key] = length
+	return reader.fieldnames or [], widths
+
+
+def make_header(fieldnames, widths):
+	header = []
+	for key in fieldnames:
+		for i in range(1, widths[key] + 1):
+			header.append("{0} {1}".format(key, i))
+	return header
+
+
+def flatten_group(group, fieldnames, widths):
+	row = []
+	for key in fieldnames:
+		values = [sub_row[key] for sub_row in group if sub_row[key]]
+		row += values + [""] * (widths[key] - len(values))
+	return row
+
+
+def parse_args(args=None):
+	parser = argparse.ArgumentParser(description="Flatten a ContentDM CSV export to one row per record.")
+	parser.add_argument("input", help="CSV export to flatten, or - for stdin")
+	parser.add_argument("output", help="flattened CSV to write, or - for stdout")
+	parser.add_argument("--id-column", default="identifier",
+	                    help="column that is only filled on the first row of each record")
+	return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+	args = parse_args()
+	f_in = sys.stdin if args.input == "-" else open(args.input, newline="")
+	f_out = sys.stdout if args.output == "-" else open(args.output, mode="w", newline="")
+	try:
+		flatten_file(f_in, f_out, args.id_column)
+	finally:
+		if f_in is not sys.stdin:
+			f_in.close()
+		if f_out is not sys.stdout:
+			f_out.close()
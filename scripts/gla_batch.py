@@ -0,0 +1,175 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from gla_utils import TagBuilder, CollexValidator, iter_rdf_items
+from gla_rdf_constructor import DEFAULT_COLUMNS, DictRowMapper, RdfWriter, ShardWriter, csv_mapper, read_lists, \
+    write_rdf_stream
+from gla_ingest import iter_records
+from gla_store import STORE_SUFFIX, RecordMapper, RecordStore
+from gla_profile import Profiler, profiling_enabled
+
+
+def load_archives(manifest_filename):
+    # Paths in the manifest are relative to the manifest itself. An archive
+    # without an input is only validated, e.g. RDF delivered by a partner.
+    # Validation errors go to "errors", or next to the output by default.
+    # "columns" overrides the constructor's DEFAULT_COLUMNS mapping and
+    # "shards" (ShardWriter options) splits the output into shards.
+    base = os.path.dirname(os.path.abspath(manifest_filename))
+    with open(manifest_filename) as f:
+        archives = json.load(f)["archives"]
+
+    for archive in archives:
+        for key in ("input", "output", "errors"):
+            if archive.get(key):
+                archive[key] = os.path.join(base, archive[key])
+    return archives
+
+
+def build_archive(archive):
+    start = time.time()
+    validator = CollexValidator(archive["ns_name"], archive["ns_address"])
+    records = [0]
+    profiler = None
+    if archive.get("profile") or profiling_enabled():
+        profiler = Profiler()
+        profiler.instrument_validator(validator)
+
+    if archive.get("input"):
+        tb = TagBuilder(archive["ns_name"], archive["ns_address"])
+        columns = archive.get("columns", DEFAULT_COLUMNS)
+        if archive["input"].endswith(".csv"):
+            rows = read_lists(archive["input"])
+            mapper = csv_mapper(rows, archive["ns_name"], columns)
+        elif archive["input"].endswith(STORE_SUFFIX):
+            # already mapped, so "columns" doesn't apply
+            rows = RecordStore(archive["input"])
+            mapper = RecordMapper()
+        else:
+            rows = iter_records(archive["input"])
+            mapper = DictRowMapper(archive["ns_name"], columns)
+        store = rows if isinstance(rows, RecordStore) else None
+        if profiler is not None:
+            rows = profiler.iterate(rows, "read")
+            profiler.instrument(mapper, "build_item", "make_item_rdf")
+
+        def items():
+            for row in rows:
+                records[0] += 1
+                yield mapper.build_item(row, tb)
+
+        make_parent_dir(archive["output"])
+        f = None
+        if archive.get("shards") is not None:
+            writer = ShardWriter(tb, archive["output"], **archive["shards"])
+        else:
+            f = open(archive["output"], mode="wb")
+            writer = RdfWriter(tb, f)
+        if profiler is not None:
+            profiler.instrument(writer, "write", "serialize")
+        try:
+            errors = write_rdf_stream(items(), tb, f, validator=validator, writer=writer)
+        finally:
+            if f is not None:
+                f.close()
+            if store is not None:
+                store.close()
+    else:
+        errors = ""
+        items = iter_rdf_items(archive["output"])
+        if profiler is not None:
+            items = profiler.iterate(items, "read")
+        for item in items:
+            records[0] += 1
+            error_string = validator.validate_object(item)
+            if error_string:
+                errors += error_string + "\n"
+
+    errors_filename = None
+    if errors:
+        errors_filename = archive.get("errors") or archive["output"] + ".errors.txt"
+        make_parent_dir(errors_filename)
+        with open(errors_filename, mode="w") as f:
+            f.write(errors)
+
+    profile_filename = None
+    if profiler is not None:
+        profile_filename = archive["output"] + ".profile.json"
+        profiler.write_report(profile_filename, records[0])
+
+    return {"ns_name": archive["ns_name"],
+            "output": archive["output"],
+            "records": records[0],
+            "errors": errors.count("\n"),
+            "errors_file": errors_filename,
+            "profile_file": profile_filename,
+            "seconds": time.time() - start}
+
+
+def make_parent_dir(filename):
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # another worker may have created it first
+            if not os.path.isdir(directory):
+                raise
+
+
+def build_all(archives, processes=None):
+    # Archives are built concurrently, one per worker; the summary keeps the
+    # manifest order regardless of which archive finishes first.
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(build_archive, archives, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def print_summary(results, seconds):
+    print("{0:<16} {1:>8} {2:>8} {3:>9}".format("archive", "records", "errors", "seconds"))
+    for result in results:
+        print("{ns_name:<16} {records:>8} {errors:>8} {seconds:>9.2f}".format(**result))
+    print("{0:<16} {1:>8} {2:>8} {3:>9.2f}".format("total",
+                                                  sum(result["records"] for result in results),
+                                                  sum(result["errors"] for result in results),
+                                                  seconds))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Build and validate every archive listed in a manifest.")
+    parser.add_argument("manifest", help="JSON manifest of archives, e.g. metadata/archives.json")
+    parser.add_argument("--only", nargs="+", help="namespace names of the archives to build")
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--summary", help="write the per-archive summary to this JSON file")
+    parser.add_argument("--profile", action="store_true",
+                        help="write stage and rule timings to <output>.profile.json (or set GLA_PROFILE=1)")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    archives = load_archives(args.manifest)
+    if args.only:
+        archives = [archive for archive in archives if archive["ns_name"] in args.only]
+    if args.profile:
+        for archive in archives:
+            archive["profile"] = True
+
+    start = time.time()
+    results = build_all(archives, args.processes)
+    print_summary(results, time.time() - start)
+
+    if args.summary:
+        with open(args.summary, mode="w") as f:
+            json.dump(results, f, indent=2)
+
+    if any(result["errors"] for result in results):
+        sys.exit(1)
@@ -0,0 +1,325 @@
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+from lxml import etree
+
+from gla_utils import TagBuilder, CollexValidator
+from gla_rdf_constructor import main as build_rdf, make_item_fields, make_item_rdf, read_rows, write_rdf_stream
+from flatten_csv import flatten_csv
+from gla_store import RecordStore, build_store, store_to_rdf
+from gla_profile import peak_rss_mb
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "metadata", "newberry_chicago_refined.csv")
+NS_NAME = "bench"
+NS_ADDRESS = "http://bench.org/#"
+
+STAGES = ["make_item_rdf",
+          "constructor_main",
+          "constructor_main_stream",
+          "validate_rdf",
+          "validate_object",
+          "validate_rdf_file",
+          "validate_rdf_parallel",
+          "store_to_rdf",
+          "flatten"]
+
+# stages that start their own process pool, run in the benchmark process
+POOL_STAGES = ("validate_rdf_parallel",)
+
+
+def build_item_per_field(tb, weblink, fields):
+    # The pre-build_item() way of making an item: one per-field method call
+    # and one append per field.
+    item = tb.item(weblink=weblink)
+    for field, value in fields:
+        if field == "role":
+            item.append(tb.role(*value))
+        elif field == "collex_date":
+            item.append(tb.collex_date(*value))
+        elif field in ("seeAlso", "thumbnail"):
+            item.append(getattr(tb, field)(weblink=value))
+        else:
+            item.append(getattr(tb, field)(value))
+    return item
+
+
+def bench_item_builder(input_filename, repeat=5):
+    tb = TagBuilder(NS_NAME, NS_ADDRESS)
+    records = [(dct["about_link"], make_item_fields(dct, NS_NAME)) for dct in read_rows(input_filename)]
+
+    def per_field():
+        for weblink, fields in records:
+            build_item_per_field(tb, weblink, fields)
+
+    def compiled():
+        for weblink, fields in records:
+            tb.build_item(weblink, fields)
+
+    results = {}
+    for name, func in (("per_field", per_field), ("build_item", compiled)):
+        seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+        results[name] = len(records) / seconds
+    return results
+
+
+# synthetic corpus
+
+def generate_rows(count, sample_filename=SAMPLE_CSV, seed=0):
+    # Each column of a synthetic row is copied from a randomly chosen sample
+    # row, which keeps the sample's per-column fill rates and value
+    # frequencies. Year pairs come from a single sample row so ranges stay
+    # plausible.
+    rng = random.Random(seed)
+    sample = list(read_rows(sample_filename))
+    fieldnames = [key for key in sample[0] if key not in ("about_link", "thumb_link", "year_begin", "year_end")]
+
+    for i in range(count):
+        dct = {"about_link": "http://synthetic.gla.org/cdm/ref/collection/bench/id/{0}".format(i),
+               "thumb_link": "http://synthetic.gla.org/utils/getthumbnail/collection/bench/id/{0}".format(i)}
+        years = rng.choice(sample)
+        dct["year_begin"] = years.get("year_begin", "")
+        dct["year_end"] = years.get("year_end", "")
+        for key in fieldnames:
+            dct[key] = rng.choice(sample)[key]
+        yield dct
+
+
+def write_synthetic_csv(filename, count, sample_filename=SAMPLE_CSV, seed=0):
+    rows = generate_rows(count, sample_filename, seed)
+    first = next(rows)
+    with io.open(filename, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(first))
+        writer.writeheader()
+        writer.writerow(first)
+        for dct in rows:
+            writer.writerow(dct)
+
+
+def write_synthetic_rdf(filename, count, sample_filename=SAMPLE_CSV, seed=0):
+    tb = TagBuilder(NS_NAME, NS_ADDRESS)
+    items = (make_item_rdf(dct, tb, ns_name=NS_NAME) for dct in generate_rows(count, sample_filename, seed))
+    with open(filename, mode="wb") as f:
+        write_rdf_stream(items, tb, f)
+
+
+def write_synthetic_export(filename, count, sample_filename=SAMPLE_CSV, seed=0):
+    # An unflattened ContentDM-style export: the identifier row of each record
+    # carries its first subject and creator, continuation rows carry the rest.
+    fieldnames = ["identifier", "title", "subject", "creator"]
+    with io.open(filename, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        for dct in generate_rows(count, sample_filename, seed):
+            subjects = [value for key, value in sorted(dct.items()) if key.startswith("subject") and value.strip()]
+            creators = [value for key, value in sorted(dct.items()) if key.startswith("creator") and value.strip()]
+            writer.writerow([dct["about_link"], dct["title"],
+                             subjects[0] if subjects else "", creators[0] if creators else ""])
+            for i in range(1, max(len(subjects), len(creators))):
+                writer.writerow(["", "",
+                                 subjects[i] if i < len(subjects) else "",
+                                 creators[i] if i < len(creators) else ""])
+
+
+def make_corpus(directory, count, sample_filename=SAMPLE_CSV, seed=0):
+    corpus = {"records": count,
+              "csv": os.path.join(directory, "synthetic_{0}.csv".format(count)),
+              "rdf": os.path.join(directory, "synthetic_{0}.rdf".format(count)),
+              "export": os.path.join(directory, "synthetic_{0}_export.csv".format(count)),
+              "output": os.path.join(directory, "synthetic_{0}_output".format(count))}
+    write_synthetic_csv(corpus["csv"], count, sample_filename, seed)
+    write_synthetic_rdf(corpus["rdf"], count, sample_filename, seed)
+    write_synthetic_export(corpus["export"], count, sample_filename, seed)
+    return corpus
+
+
+# stages, each returning (records, seconds) for its timed part
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    func(*args, **kwargs)
+    return time.time() - start
+
+
+def stage_make_item_rdf(corpus):
+    tb = TagBuilder(NS_NAME, NS_ADDRESS)
+    rows = list(read_rows(corpus["csv"]))
+
+    def build():
+        for dct in rows:
+            make_item_rdf(dct, tb, ns_name=NS_NAME)
+    return len(rows), timed(build)
+
+
+def stage_constructor_main(corpus):
+    return corpus["records"], timed(build_rdf, NS_NAME, NS_ADDRESS, corpus["csv"], corpus["output"])
+
+
+def stage_constructor_main_stream(corpus):
+    return corpus["records"], timed(build_rdf, NS_NAME, NS_ADDRESS, corpus["csv"], corpus["output"], stream=True)
+
+
+def stage_validate_rdf(corpus):
+    validator = CollexValidator(NS_NAME, NS_ADDRESS)
+    return corpus["records"], timed(lambda: validator.validate_rdf(etree.parse(corpus["rdf"])))
+
+
+def stage_validate_object(corpus):
+    validator = CollexValidator(NS_NAME, NS_ADDRESS)
+    items = list(etree.parse(corpus["rdf"]).getroot())
+
+    def validate():
+        for item in items:
+            validator.validate_object(item)
+    return len(items), timed(validate)
+
+
+def stage_validate_rdf_file(corpus):
+    validator = CollexValidator(NS_NAME, NS_ADDRESS)
+    return corpus["records"], timed(validator.validate_rdf_file, corpus["rdf"])
+
+
+def stage_validate_rdf_parallel(corpus):
+    validator = CollexValidator(NS_NAME, NS_ADDRESS)
+    return corpus["records"], timed(validator.validate_rdf_parallel, corpus["rdf"])
+
+
+def stage_store_to_rdf(corpus):
+    store_filename = corpus["output"] + ".store"
+    build_store(NS_NAME, NS_ADDRESS, corpus["csv"], store_filename)
+    with RecordStore(store_filename) as store:
+        return len(store), timed(store_to_rdf, store, corpus["output"])
+
+
+def stage_flatten(corpus):
+    return corpus["records"], timed(flatten_csv, corpus["export"], corpus["output"])
+
+
+def run_stage(name, corpus):
+    devnull = open(os.devnull, "w")
+    stdout, sys.stdout = sys.stdout, devnull
+    try:
+        records, seconds = globals()["stage_" + name](corpus)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+
+    return {"stage": name,
+            "records": records,
+            "seconds": seconds,
+            "records_per_sec": records / seconds if seconds else float("inf"),
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def run_in_worker(func, *args):
+    # A worker forked from this process would start with its resident pages
+    # and peak RSS, and a spawned one keeps the peak across exec, so the
+    # worker is forked from a forkserver, which is small and never grows.
+    pool = multiprocessing.get_context("forkserver").Pool(1, maxtasksperchild=1)
+    try:
+        return pool.apply(func, args)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def run_suite(sizes, stages=STAGES, sample_filename=SAMPLE_CSV, seed=0):
+    # Every stage runs in a fresh worker process so that its peak RSS isn't
+    # polluted by earlier stages or by corpus generation. Pool stages run
+    # here instead, so their peak RSS includes the benchmark's own.
+    results = []
+    directory = tempfile.mkdtemp(prefix="gla_benchmark_")
+    try:
+        for count in sizes:
+            corpus = make_corpus(directory, count, sample_filename, seed)
+            for name in stages:
+                if name in POOL_STAGES:
+                    # pool workers can't start a pool of their own
+                    results.append(run_stage(name, corpus))
+                    continue
+                results.append(run_in_worker(run_stage, name, corpus))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    expected = dict(((result["stage"], result["records"]), result["records_per_sec"]) for result in baseline)
+    regressions = []
+    for result in results:
+        baseline_rate = expected.get((result["stage"], result["records"]))
+        if baseline_rate and result["records_per_sec"] < baseline_rate * (1 - threshold):
+            regressions.append("{0} at {1} records: {2:,.0f} records/sec, baseline {3:,.0f}".format(
+                result["stage"], result["records"], result["records_per_sec"], baseline_rate))
+    return regressions
+
+
+def print_results(results):
+    print("{0:<24} {1:>10} {2:>10} {3:>14} {4:>12}".format("stage", "records", "seconds", "records/sec", "peak RSS MB"))
+    for result in results:
+        print("{stage:<24} {records:>10} {seconds:>10.3f} {records_per_sec:>14,.0f} {peak_rss_mb:>12.1f}".format(**result))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the GLA RDF pipeline.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    suite = subparsers.add_parser("suite", help="time the pipeline stages on synthetic corpora")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    suite.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    suite.add_argument("--sample", default=SAMPLE_CSV, help="refined CSV to draw field distributions from")
+    suite.add_argument("--json", help="write the results to this file")
+    suite.add_argument("--baseline", help="results file from an earlier run to compare against")
+    suite.add_argument("--threshold", type=float, default=0.2,
+                       help="fail if records/sec drops more than this fraction below the baseline")
+
+    generate = subparsers.add_parser("generate", help="write a synthetic corpus")
+    generate.add_argument("records", type=int)
+    generate.add_argument("directory")
+    generate.add_argument("--sample", default=SAMPLE_CSV)
+    generate.add_argument("--seed", type=int, default=0)
+
+    item_builder = subparsers.add_parser("item-builder", help="compare build_item() to the per-field methods")
+    item_builder.add_argument("input", help="refined CSV to build items from")
+    item_builder.add_argument("--repeat", type=int, default=5)
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.command == "generate":
+        print(json.dumps(make_corpus(args.directory, args.records, args.sample, args.seed), indent=2))
+
+    elif args.command == "item-builder":
+        results = bench_item_builder(args.input, args.repeat)
+        for name in ("per_field", "build_item"):
+            print("{0:>10}: {1:,.0f} items/sec".format(name, results[name]))
+        print("   speedup: {0:.2f}x".format(results["build_item"] / results["per_field"]))
+
+    elif args.command == "suite":
+        results = run_suite(args.sizes, args.stages, args.sample)
+        print_results(results)
+        if args.json:
+            with open(args.json, mode="w") as f:
+                json.dump(results, f, indent=2)
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = find_regressions(results, json.load(f), args.threshold)
+            for regression in regressions:
+                print("REGRESSION: " + regression)
+            if regressions:
+                sys.exit(1)
+
+    else:
+        parse_args(["--help"])
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+import re
+
+# Free-text dates as they come out of CONTENTdm and OAI-PMH exports, e.g.
+# "1930s?", "1944-1968", "[ca. 1720]", "1948-05-10" or "1851\n\n2003",
+# turned into a Collex rdf:value ("1930", "193u", "1944,1968") and a label.
+#
+# A dc:date often carries more than one line: the item's date first, then
+# CONTENTdm stamps such as "4/29/2008", "2003" or "March 2004". Only the
+# first line with a year in it is used, and bare M/D/YYYY lines are never
+# the date of the item.
+
+STAMP_REGEX = re.compile(r"^\d{1,2}/\d{1,2}/\d{2,4}$")
+BRACKETS_REGEX = re.compile(r"[\[\]]")
+CIRCA_REGEX = re.compile(r"\b(?:ca|c|circa)\.?\s*(?=\d)", re.IGNORECASE)
+FULL_DATE_REGEX = re.compile(r"(?<!\d)(1[0-9]{3}|20[0-9]{2})-(?:0?[1-9]|1[0-2])(?:-\d{1,2})?(?!\d)|"
+                             r"(?<!\d)\d{1,2}/\d{1,2}/(1[0-9]{3}|20[0-9]{2})(?!\d)")
+# "1861-65": a range whose last year is abbreviated
+SHORT_RANGE_REGEX = re.compile(r"(?<!\d)(1[0-9]{3}|20[0-9]{2})-(\d{2})(?!\d)")
+DECADE_REGEX = re.compile(r"(?<!\d)(1[0-9]{2}|20[0-9])0s\b")
+YEAR_REGEX = re.compile(r"(?<!\d)(1[0-9]{3}|20[0-9]{2})(?!\d)")
+# rdf:value of a collex:date: "1930", "193u", "18uu" or "1944,1968"
+DATE_VALUE_REGEX = re.compile(r"^(\d{2})(\d|u)(\d|u)$")
+
+
+def parse_date(text):
+    # (label, value) for the first dated line of text, or None.
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line or STAMP_REGEX.match(line):
+            continue
+        date = parse_line(line)
+        if date is not None:
+            return date
+    return None
+
+
+def parse_line(line):
+    label = " ".join(CIRCA_REGEX.sub("c. ", BRACKETS_REGEX.sub("", line)).split()).rstrip(".")
+    text = FULL_DATE_REGEX.sub(lambda match: match.group(1) or match.group(2), label)
+    text = SHORT_RANGE_REGEX.sub(expand_short_range, text)
+
+    # (first year, last year, rdf:value) for every decade and year
+    spans = []
+    for match in DECADE_REGEX.finditer(text):
+        if match.group(1).endswith("0"):
+            # "1800s" is a century
+            prefix = match.group(1)[:2]
+            spans.append((prefix + "00", prefix + "99", prefix + "uu"))
+        else:
+            spans.append((match.group(1) + "0", match.group(1) + "9", match.group(1) + "u"))
+    text = DECADE_REGEX.sub(" ", text)
+    for year in YEAR_REGEX.findall(text):
+        spans.append((year, year, year))
+
+    if not spans:
+        return None
+    if len(set(span[2] for span in spans)) == 1:
+        return label, spans[0][2]
+    return label, "{0},{1}".format(min(span[0] for span in spans), max(span[1] for span in spans))
+
+
+def expand_short_range(match):
+    # "1861-65" -> "1861-1865"; "1895-20" ends in the next century
+    first = int(match.group(1))
+    last = first // 100 * 100 + int(match.group(2))
+    if last < first:
+        last += 100
+    return "{0}-{1}".format(first, last)
+
+
+def date_range(date):
+    # (first year, last year) of a collex:date rdf:value, or None
+    years = []
+    for part in date.split(","):
+        match = DATE_VALUE_REGEX.match(part.strip())
+        if match is None:
+            return None
+        century, decade, year = match.groups()
+        if decade == "u":
+            years += [int(century + "00"), int(century + "99")]
+        elif year == "u":
+            years += [int(century + decade + "0"), int(century + decade + "9")]
+        else:
+            years.append(int(century + decade + year))
+    return min(years), max(years)
+
+
+class DateNormalizer:
+    # parse_date() behind an LRU cache keyed on the raw string: the same few
+    # hundred date strings repeat thousands of times per archive.
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, text):
+        try:
+            date = self.cache.pop(text)
+            self.hits += 1
+        except KeyError:
+            date = parse_date(text)
+            self.misses += 1
+            if len(self.cache) >= self.maxsize:
+                self.cache.popitem(last=False)
+        self.cache[text] = date
+        return date
+
+    def normalize_all(self, texts):
+        # Parses each distinct string once, however often it repeats.
+        texts = list(texts)
+        dates = dict((text, self.normalize(text)) for text in set(texts))
+        return [dates[text] for text in texts]
+
+
+DATES = DateNormalizer()
+
+
+def normalize_date(text):
+    return DATES.normalize(text)
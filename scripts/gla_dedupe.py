@@ -0,0 +1,195 @@
+import argparse
+import csv
+import hashlib
+import random
+import re
+import struct
+import sys
+
+from gla_utils import ABOUT_ATTRIB, COLLEX_NS, DC_NS, VALUE_TAG, iter_rdf_items, match_contentdm
+
+TITLE_TAG = "{{{0}}}title".format(DC_NS)
+IDENTIFIER_TAG = "{{{0}}}identifier".format(DC_NS)
+DATE_TAG = "{{{0}}}date".format(DC_NS)
+ARCHIVE_TAG = "{{{0}}}archive".format(COLLEX_NS)
+
+URL_REGEX = re.compile(r"^(https?)://([^/:]+)(:\d+)?(.*)$")
+PUNCTUATION_REGEX = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def item_record(item, default_archive=""):
+    date = item.find(DATE_TAG)
+    if date is not None:
+        value = date.find(".//" + VALUE_TAG)
+        date = (value.text if value is not None else date.text) or ""
+
+    archive = item.findtext(ARCHIVE_TAG)
+    return {"archive": (archive or default_archive).strip(),
+            "about": item.get(ABOUT_ATTRIB) or "",
+            "title": item.findtext(TITLE_TAG) or "",
+            "date": date_key(date or ""),
+            "identifiers": [identifier.text for identifier in item.iterfind(IDENTIFIER_TAG) if identifier.text]}
+
+
+def normalize_about(about):
+    about = about.strip()
+    contentdm = match_contentdm(about)
+    if contentdm:
+        scheme, host, collection, item_id = contentdm
+        return "contentdm:{0}:{1}:{2}".format(host.lower(), collection, item_id)
+
+    match = URL_REGEX.match(about)
+    if match:
+        scheme, host, port, path = match.groups()
+        if port in (":80", ":443"):
+            port = ""
+        return "{0}://{1}{2}{3}".format(scheme.lower(), host.lower(), port or "", path.rstrip("/"))
+    return about
+
+
+def normalize_identifier(identifier):
+    return " ".join(identifier.lower().split())
+
+
+def normalize_title(title):
+    return " ".join(PUNCTUATION_REGEX.sub(" ", title.lower()).split())
+
+
+def date_key(date):
+    return "".join(date.split())
+
+
+def shingles(text, size=4):
+    if len(text) <= size:
+        return set([text]) if text else set()
+    return set(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / float(len(a | b))
+
+
+class DuplicateIndex:
+    # Exact duplicates share a normalized rdf:about or dc:identifier. Near
+    # duplicates are found with MinHash/LSH over character shingles of the
+    # title: a record is only compared with records that share one of its
+    # band buckets. The normalized date is part of every bucket key, so only
+    # titles with the same date can match. Candidates are confirmed with the
+    # exact Jaccard similarity of their shingles.
+    def __init__(self, num_perm=64, bands=16, threshold=0.8, max_bucket_size=200, seed=0):
+        rng = random.Random(seed)
+        self.masks = [rng.getrandbits(64) for _ in range(num_perm)]
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_bucket_size = max_bucket_size
+
+        self.records = []
+        self.titles = []
+        self.parents = []
+        self.reasons = {}
+        self.exact_keys = {}
+        self.buckets = {}
+
+    def add(self, record):
+        index = len(self.records)
+        self.records.append((record["archive"], record["about"], record["title"], record["date"]))
+        self.parents.append(index)
+
+        keys = [("about", normalize_about(record["about"]))]
+        keys += [("identifier", normalize_identifier(identifier)) for identifier in record["identifiers"]]
+        for key in keys:
+            if not key[1]:
+                continue
+            other = self.exact_keys.setdefault(key, index)
+            if other != index:
+                self.union(other, index, key[0])
+
+        title = normalize_title(record["title"])
+        self.titles.append(title)
+        title_shingles = shingles(title)
+        if not title_shingles:
+            return
+        signature = self.signature(title_shingles)
+        candidates = set()
+        for band in range(self.bands):
+            key = (band, record["date"], tuple(signature[band * self.rows:(band + 1) * self.rows]))
+            bucket = self.buckets.setdefault(key, [])
+            candidates.update(bucket)
+            if len(bucket) < self.max_bucket_size:
+                bucket.append(index)
+
+        for other in sorted(candidates):
+            if self.find(other) != self.find(index) and \
+                    jaccard(title_shingles, shingles(self.titles[other])) >= self.threshold:
+                self.union(other, index, "title+date")
+
+    def signature(self, title_shingles):
+        # One 64-bit hash per shingle, permuted by XOR with a random mask per
+        # MinHash function; map() keeps the inner loop in C.
+        hashes = [struct.unpack("<Q", hashlib.md5(shingle.encode("utf-8")).digest()[:8])[0]
+                  for shingle in title_shingles]
+        return [min(map(mask.__xor__, hashes)) for mask in self.masks]
+
+    def find(self, index):
+        while self.parents[index] != index:
+            self.parents[index] = self.parents[self.parents[index]]
+            index = self.parents[index]
+        return index
+
+    def union(self, a, b, reason):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parents[root_b] = root_a
+            self.reasons.setdefault(root_a, set()).update(self.reasons.pop(root_b, set()))
+        self.reasons.setdefault(root_a, set()).add(reason)
+
+    def groups(self):
+        members = {}
+        for index in range(len(self.records)):
+            members.setdefault(self.find(index), []).append(index)
+        for root, indexes in sorted(members.items(), key=lambda pair: pair[1][0]):
+            if len(indexes) > 1:
+                yield sorted(self.reasons.get(root, [])), [self.records[index] for index in indexes]
+
+
+def index_files(filenames, index):
+    for filename in filenames:
+        for item in iter_rdf_items(filename):
+            index.add(item_record(item, default_archive=filename))
+    return index
+
+
+def write_report(index, f):
+    writer = csv.writer(f)
+    writer.writerow(["group", "match", "archive", "about", "title", "date"])
+    groups = 0
+    for groups, (reasons, records) in enumerate(index.groups(), 1):
+        for archive, about, title, date in records:
+            writer.writerow([groups, "; ".join(reasons), archive, about, title, date])
+    return groups
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Find duplicate items across Collex RDF files.")
+    parser.add_argument("rdf", nargs="+", help="Collex RDF files to index")
+    parser.add_argument("--report", help="CSV of duplicate groups (default: stdout)")
+    parser.add_argument("--threshold", type=float, default=0.8, help="title shingle similarity for near duplicates")
+    parser.add_argument("--bands", type=int, default=16)
+    parser.add_argument("--num-perm", type=int, default=64)
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    index = index_files(args.rdf, DuplicateIndex(num_perm=args.num_perm, bands=args.bands, threshold=args.threshold))
+
+    f = open(args.report, mode="w") if args.report else sys.stdout
+    try:
+        groups = write_report(index, f)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    sys.stderr.write("{0} items, {1} duplicate groups\n".format(len(index.records), groups))
@@ -0,0 +1,171 @@
+import argparse
+import csv
+from copy import deepcopy
+import hashlib
+import heapq
+import json
+import sys
+import tempfile
+
+from lxml import etree
+
+from gla_utils import ABOUT_ATTRIB, RDF_NS, RDF_TAG, TagBuilder, iter_rdf_items
+from gla_rdf_constructor import RdfWriter, serialize_rdf
+
+# (rdf:about, hash) pairs sorted in memory before a run goes to disk
+RUN_SIZE = 100000
+
+
+def canonical_item(element):
+    # The element as a string that doesn't depend on the order of its
+    # children or on whitespace: attributes and children are sorted, text is
+    # collapsed and comments are dropped.
+    text = [element.text or ""] + [child.tail or "" for child in element]
+    children = sorted(canonical_item(child) for child in element if isinstance(child.tag, str))
+    return json.dumps([element.tag, sorted(element.attrib.items()), " ".join("".join(text).split()), children])
+
+
+def item_hash(item):
+    return hashlib.sha1(canonical_item(item).encode("utf-8")).hexdigest()
+
+
+def sorted_item_hashes(filename, run_size=RUN_SIZE, directory=None):
+    # (rdf:about, hash) for every item of the file, sorted by rdf:about. Up
+    # to run_size pairs are sorted in memory; beyond that sorted runs are
+    # spilled to temporary files and merged. If an rdf:about appears more
+    # than once the last item wins.
+    runs = []
+    batch = []
+    try:
+        for item in iter_rdf_items(filename):
+            about = (item.get(ABOUT_ATTRIB) or "").strip()
+            if about:
+                batch.append((about, item_hash(item)))
+            if len(batch) >= run_size:
+                runs.append(write_run(batch, directory))
+                batch = []
+
+        batch.sort(key=lambda pair: pair[0])
+        if not runs:
+            pairs = iter(batch)
+        else:
+            pairs = heapq.merge(*([read_run(run) for run in runs] + [iter(batch)]), key=lambda pair: pair[0])
+
+        previous = None
+        for pair in pairs:
+            if previous is not None and previous[0] != pair[0]:
+                yield previous
+            previous = pair
+        if previous is not None:
+            yield previous
+    finally:
+        for run in runs:
+            run.close()
+
+
+def write_run(batch, directory=None):
+    batch.sort(key=lambda pair: pair[0])
+    run = tempfile.TemporaryFile(mode="w+", encoding="utf-8", dir=directory)
+    for about, digest in batch:
+        run.write("{0}\t{1}\n".format(about, digest))
+    run.seek(0)
+    return run
+
+
+def read_run(run):
+    for line in run:
+        about, digest = line.rstrip("\n").rsplit("\t", 1)
+        yield about, digest
+
+
+def diff_hashes(old, new):
+    # Merge join of two sorted (rdf:about, hash) streams into
+    # (change, rdf:about) with change "added", "removed", "changed" or
+    # "unchanged", in rdf:about order.
+    old, new = iter(old), iter(new)
+    old_pair, new_pair = next(old, None), next(new, None)
+    while old_pair is not None or new_pair is not None:
+        if new_pair is None or (old_pair is not None and old_pair[0] < new_pair[0]):
+            yield "removed", old_pair[0]
+            old_pair = next(old, None)
+        elif old_pair is None or new_pair[0] < old_pair[0]:
+            yield "added", new_pair[0]
+            new_pair = next(new, None)
+        else:
+            yield ("unchanged" if old_pair[1] == new_pair[1] else "changed"), new_pair[0]
+            old_pair, new_pair = next(old, None), next(new, None)
+
+
+def diff_files(old_filename, new_filename, changes, run_size=RUN_SIZE, directory=None):
+    # Writes the change set as CSV rows of (change, rdf:about) and returns
+    # the count of each kind of change along with the rdf:abouts the delta
+    # needs.
+    writer = csv.writer(changes)
+    writer.writerow(["change", "about"])
+    counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    delta = set()
+
+    for change, about in diff_hashes(sorted_item_hashes(old_filename, run_size, directory),
+                                     sorted_item_hashes(new_filename, run_size, directory)):
+        counts[change] += 1
+        if change == "unchanged":
+            continue
+        writer.writerow([change, about])
+        if change != "removed":
+            delta.add(about)
+    return counts, delta
+
+
+def write_delta(new_filename, abouts, f):
+    # The added and changed items, copied out of the new release into an
+    # rdf:RDF document with the archive's namespaces.
+    writer = None
+    for item in iter_rdf_items(new_filename):
+        if writer is None:
+            writer = RdfWriter(TagBuilder(item.prefix, etree.QName(item).namespace), f)
+        if (item.get(ABOUT_ATTRIB) or "").strip() in abouts:
+            writer.write(strip_whitespace(deepcopy(item)))
+
+    if writer is None:
+        f.write(serialize_rdf(etree.Element(RDF_TAG, nsmap={"rdf": RDF_NS})))
+        return 0
+    writer.close()
+    return writer.count
+
+
+def strip_whitespace(item):
+    # drops the source's indentation so the item is pretty printed like
+    # the constructor's output
+    for element in item.iter():
+        if element.text is not None and not element.text.strip():
+            element.text = None
+        if element.tail is not None and not element.tail.strip():
+            element.tail = None
+    return item
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="List the items added, removed or changed between two RDF releases.")
+    parser.add_argument("old", help="RDF file of the previous release")
+    parser.add_argument("new", help="RDF file of the new release")
+    parser.add_argument("--changes", help="CSV change set (default: stdout)")
+    parser.add_argument("--delta", help="write the added and changed items to this RDF file")
+    parser.add_argument("--run-size", type=int, default=RUN_SIZE, help="items sorted in memory per run")
+    parser.add_argument("--tmpdir", help="directory for sorted runs")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    f = open(args.changes, mode="w", newline="") if args.changes else sys.stdout
+    try:
+        counts, delta = diff_files(args.old, args.new, f, args.run_size, args.tmpdir)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+    if args.delta:
+        with open(args.delta, mode="wb") as f:
+            write_delta(args.new, delta, f)
+    sys.stderr.write("{added} added, {removed} removed, {changed} changed, {unchanged} unchanged\n".format(**counts))
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+from io import BytesIO
+import json
+import os
+import shutil
+
+import aiohttp
+from lxml import etree
+
+from gla_utils import TagBuilder
+from gla_rdf_constructor import DEFAULT_COLUMNS, DictRowMapper, RdfWriter, serialize_rdf, split_rdf_document
+from gla_ingest import iter_records
+from gla_batch import load_archives, make_parent_dir
+
+OAI_NS = "http://www.openarchives.org/OAI/2.0/"
+TOKEN_TAG = "{{{0}}}resumptionToken".format(OAI_NS)
+ERROR_TAG = "{{{0}}}error".format(OAI_NS)
+
+
+class HarvestError(Exception):
+    pass
+
+
+class Harvester:
+    # Harvests OAI-PMH ListRecords sets concurrently over one pooled session.
+    # Each page is converted to Collex items as soon as it arrives and its
+    # items are appended to <output>.parts; the checkpoint file records the
+    # next resumptionToken and the size of the parts file after every page,
+    # so an interrupted harvest picks up from the last completed page. Once
+    # the last page is in, the checkpoint is marked done and a rerun only
+    # assembles the output from the parts file.
+    def __init__(self, checkpoint_filename, concurrency=4, retries=5, backoff=1.0, timeout=120):
+        self.checkpoint_filename = checkpoint_filename
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.checkpoint = load_checkpoint(checkpoint_filename)
+
+    async def harvest(self, archives):
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def harvest_one(archive):
+            async with semaphore:
+                return await self.harvest_archive(session, archive)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            return await asyncio.gather(*[harvest_one(archive) for archive in archives])
+
+    async def harvest_archive(self, session, archive):
+        oai = archive["oai"]
+        tb = TagBuilder(archive["ns_name"], archive["ns_address"])
+        writer = RdfWriter(tb, None)
+        mapper = DictRowMapper(archive["ns_name"], archive.get("columns", DEFAULT_COLUMNS))
+        state = self.checkpoint.get(archive["ns_name"])
+        parts_filename = archive["output"] + ".parts"
+        loop = asyncio.get_running_loop()
+
+        if state is not None and (not os.path.exists(parts_filename) or
+                                  os.path.getsize(parts_filename) < state["offset"]):
+            # the parts file is missing or shorter than the checkpoint says,
+            # e.g. after a crash between removing it and clearing the
+            # checkpoint: start over rather than pad it and resume
+            state = None
+        if state is None:
+            state = {"token": None, "offset": 0, "records": 0, "done": False}
+
+        make_parent_dir(parts_filename)
+        with open(parts_filename, mode="r+b" if os.path.exists(parts_filename) else "wb") as parts:
+            # drop anything written after the last checkpoint
+            parts.truncate(state["offset"])
+            parts.seek(state["offset"])
+
+            while not state.get("done"):
+                if state["token"]:
+                    params = {"verb": "ListRecords", "resumptionToken": state["token"]}
+                else:
+                    params = {"verb": "ListRecords",
+                              "metadataPrefix": oai.get("metadata_prefix", "oai_dc")}
+                    if oai.get("set"):
+                        params["set"] = oai["set"]
+
+                body = await self.fetch_page(session, oai["url"], params)
+                items_bytes, records, token = await loop.run_in_executor(None, convert_page, body, tb, writer, mapper)
+
+                parts.write(items_bytes)
+                parts.flush()
+                state = {"token": token, "offset": parts.tell(), "records": state["records"] + records,
+                         "done": not token}
+                self.save_state(archive["ns_name"], state)
+
+        finish_output(tb, parts_filename, archive["output"], state["records"])
+        os.remove(parts_filename)
+        self.save_state(archive["ns_name"], None)
+
+        return {"ns_name": archive["ns_name"], "output": archive["output"], "records": state["records"]}
+
+    async def fetch_page(self, session, url, params):
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status == 429 or response.status >= 500:
+                        raise aiohttp.ClientResponseError(response.request_info, response.history,
+                                                          status=response.status, message=response.reason)
+                    if response.status >= 400:
+                        raise HarvestError("{0} returned HTTP {1}".format(url, response.status))
+                    return await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise HarvestError("{0} failed after {1} attempts: {2!r}".format(url, attempt + 1, e))
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    def save_state(self, ns_name, state):
+        if state is None:
+            self.checkpoint.pop(ns_name, None)
+        else:
+            self.checkpoint[ns_name] = state
+        save_checkpoint(self.checkpoint_filename, self.checkpoint)
+
+
+def convert_page(body, tb, writer, mapper):
+    token, error_code = parse_page(body)
+    if error_code == "noRecordsMatch":
+        return b"", 0, None
+    if error_code:
+        raise HarvestError("OAI-PMH error: {0}".format(error_code))
+
+    chunks = []
+    for dct in iter_records(BytesIO(body)):
+        chunks.append(writer.item_bytes(mapper.build_item(dct, tb)))
+    return b"".join(chunks), len(chunks), token
+
+
+def parse_page(body):
+    token = error_code = None
+    for event, element in etree.iterparse(BytesIO(body), events=("end",), tag=(TOKEN_TAG, ERROR_TAG)):
+        if element.tag == TOKEN_TAG:
+            token = (element.text or "").strip() or None
+        else:
+            error_code = element.get("code")
+    return token, error_code
+
+
+def finish_output(tb, parts_filename, output_filename, records):
+    with open(output_filename, mode="wb") as f:
+        if not records:
+            f.write(serialize_rdf(tb.root()))
+            return
+
+        head, tail = split_rdf_document(tb)
+        f.write(head)
+        with open(parts_filename, mode="rb") as parts:
+            shutil.copyfileobj(parts, f)
+        f.write(tail)
+
+
+def load_checkpoint(checkpoint_filename):
+    if not os.path.exists(checkpoint_filename):
+        return {}
+    with open(checkpoint_filename) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_filename, checkpoint):
+    temp_filename = checkpoint_filename + ".tmp"
+    with open(temp_filename, mode="w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_filename, checkpoint_filename)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Harvest the OAI-PMH sets listed in an archive manifest.")
+    parser.add_argument("manifest", help="JSON manifest of archives, e.g. metadata/archives.json")
+    parser.add_argument("--only", nargs="+", help="namespace names of the archives to harvest")
+    parser.add_argument("--concurrency", type=int, default=4, help="sets harvested at once")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--checkpoint", help="checkpoint file (default: next to the manifest)")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    archives = [archive for archive in load_archives(args.manifest) if archive.get("oai")]
+    if args.only:
+        archives = [archive for archive in archives if archive["ns_name"] in args.only]
+
+    checkpoint_filename = args.checkpoint or os.path.splitext(args.manifest)[0] + "_harvest_checkpoint.json"
+    harvester = Harvester(checkpoint_filename, concurrency=args.concurrency, retries=args.retries)
+    for result in asyncio.run(harvester.harvest(archives)):
+        print("{ns_name:<16} {records:>8}  {output}".format(**result))
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import re
+
+# Subject headings and creator names as they come out of the refined CSVs
+# and OAI-PMH exports, e.g. "Illinois--Chicago\n", "streets" or
+# "Arrowsmith, Aaron, 1750-1823.; Pachoux, J. J.", turned into the
+# separate, consistently written headings Collex facets on.
+#
+# Lists are split on ";", and subject headings also on the "--" between
+# LCSH subdivisions. Each heading has its whitespace collapsed, a leading
+# lowercase letter capitalized and a trailing period dropped, unless the
+# period ends an initial ("Sloan, Percy H.") or an abbreviation ("etc.").
+
+LIST_REGEX = re.compile(r"\s*;\s*")
+SUBDIVISION_REGEX = re.compile(r"\s*(?:;|--)\s*")
+# " :" is left alone: LC headings write "(1861-1865 : Lincoln)" with a space
+SPACE_BEFORE_PUNCTUATION_REGEX = re.compile(r"\s+([,;)])")
+ABBREVIATIONS = ("bros", "co", "corp", "dept", "dr", "etc", "inc", "jr", "ltd", "messrs", "mr", "mrs", "ms", "rev", "sr",
+                 "st")
+
+
+def split_list(value):
+    return [part for part in LIST_REGEX.split(value.strip()) if part]
+
+
+def canonical_heading(heading):
+    heading = SPACE_BEFORE_PUNCTUATION_REGEX.sub(r"\1", " ".join(heading.split()))
+    if heading[:1].islower():
+        heading = heading[0].upper() + heading[1:]
+    if heading.endswith("."):
+        last_word = heading[:-1].split(" ")[-1]
+        if len(last_word) > 1 and "." not in last_word and last_word.lower() not in ABBREVIATIONS:
+            heading = heading[:-1]
+    return heading
+
+
+def parse_headings(value, subdivisions=False):
+    # The distinct canonical headings in value, in order.
+    regex = SUBDIVISION_REGEX if subdivisions else LIST_REGEX
+    headings = []
+    for part in regex.split(value.strip()):
+        heading = canonical_heading(part)
+        if heading and heading not in headings:
+            headings.append(heading)
+    return tuple(headings)
+
+
+class HeadingNormalizer:
+    # parse_headings() behind an LRU cache keyed on the raw value, so the
+    # same heading repeated across thousands of records is cleaned up once.
+    # Canonical strings are interned in `strings`: every record gets the
+    # same string object for the same heading. Both are bounded; dropping
+    # an interned string only costs sharing, never correctness.
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.strings = {}
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, value, subdivisions=False):
+        key = (value, subdivisions)
+        try:
+            headings = self.cache.pop(key)
+            self.hits += 1
+        except KeyError:
+            headings = tuple(self.intern(heading) for heading in parse_headings(value, subdivisions))
+            self.misses += 1
+            if len(self.cache) >= self.maxsize:
+                self.cache.popitem(last=False)
+        self.cache[key] = headings
+        return headings
+
+    def intern(self, string):
+        interned = self.strings.get(string)
+        if interned is None:
+            if len(self.strings) >= 4 * self.maxsize:
+                self.strings.clear()
+            interned = self.strings[string] = string
+        return interned
+
+
+HEADINGS = HeadingNormalizer()
+
+
+def normalize_subjects(value):
+    return HEADINGS.normalize(value, subdivisions=True)
+
+
+def normalize_names(value):
+    return HEADINGS.normalize(value)
@@ -0,0 +1,132 @@
+from lxml import etree
+
+from gla_utils import TagBuilder, CollexValidator, ABOUT_ATTRIB, DC_NS, RDF_NS, match_contentdm
+from gla_rdf_constructor import make_item_rdf, write_rdf_stream
+from gla_headings import split_list
+
+
+OAI_DC_TAG = "{http://www.openarchives.org/OAI/2.0/oai_dc/}dc"
+DESCRIPTION_TAG = "{{{0}}}Description".format(RDF_NS)
+
+# dc elements whose values are lists packed into one string, e.g.
+# "Indians of North America; Ojibwa Indians", mapped to the numbered CSV
+# columns ("subject 1", "subject 2", ...) that make_item_rdf reads.
+# dc:contributor is left out: no column maps it, and its values are mostly
+# holding collections ("Rand McNally Collection.") rather than a role.
+SPLIT_FIELDS = {"subject": "subject",
+                "coverage": "location",
+                "creator": "creator"}
+
+# dc elements kept one column per element ("identifier 1", ...).
+NUMBERED_FIELDS = {"identifier": "identifier",
+                   "description": "description"}
+
+# dc elements joined into a single column. "date" is left as free text for
+# gla_dates to turn into a collex:date.
+JOINED_FIELDS = {"title": "title",
+                 "format": "format",
+                 "type": "type",
+                 "source": "source",
+                 "publisher": "publisher",
+                 "rights": "rights",
+                 "language": "language",
+                 "relation": "relation",
+                 "date": "date"}
+
+
+def main(ns_name, ns_address, input_filename, output_filename):
+    tb = TagBuilder(ns_name, ns_address)
+    validator = CollexValidator(ns_name, ns_address)
+
+    items = (make_item_rdf(dct, tb, ns_name=ns_name) for dct in iter_records(input_filename))
+    with open(output_filename, mode="wb") as f:
+        print(write_rdf_stream(items, tb, f, validator=validator))
+
+
+def iter_records(source):
+    for element in iter_record_elements(source):
+        dct = record_to_row(element)
+        if dct is not None:
+            yield dct
+
+
+def iter_record_elements(source):
+    # Streams oai_dc:dc and rdf:Description records out of an OAI-PMH
+    # ListRecords dump or a CONTENTdm RDF export, clearing each record once
+    # it has been converted, along with everything before it and before its
+    # ancestors, so at most one record is in memory.
+    for event, element in etree.iterparse(source, events=("end",), tag=(OAI_DC_TAG, DESCRIPTION_TAG)):
+        yield element
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+        for ancestor in element.iterancestors():
+            while ancestor.getprevious() is not None:
+                del ancestor.getparent()[0]
+
+
+def record_to_row(element):
+    values = {}
+    for child in element.iterchildren(tag=etree.Element):
+        if not child.tag.startswith("{{{0}}}".format(DC_NS)):
+            continue
+        text = (child.text or "").strip()
+        if text:
+            values.setdefault(etree.QName(child).localname, []).append(text)
+
+    about_link = get_about_link(element, values.get("identifier", []))
+    if not about_link:
+        return None
+
+    dct = {"about_link": about_link,
+           "thumb_link": get_thumb_link(about_link)}
+
+    for field, column in sorted(JOINED_FIELDS.items()):
+        if field in values:
+            dct[column] = "\n".join(values[field])
+
+    for field, column in sorted(NUMBERED_FIELDS.items()):
+        add_numbered_columns(dct, column, values.get(field, []))
+
+    for field, column in sorted(SPLIT_FIELDS.items()):
+        add_numbered_columns(dct, column, split_values(values.get(field, [])))
+
+    return dct
+
+
+def get_about_link(element, identifiers):
+    about_link = element.get(ABOUT_ATTRIB) or element.get("about")
+    if about_link:
+        return about_link.strip()
+
+    for identifier in identifiers:
+        if identifier.startswith("http://") or identifier.startswith("https://"):
+            return identifier
+    return ""
+
+
+def get_thumb_link(about_link):
+    contentdm = match_contentdm(about_link)
+    if contentdm:
+        return "{0}://{1}/utils/getthumbnail/collection/{2}/id/{3}".format(*contentdm)
+    return ""
+
+
+def split_values(values):
+    parts = []
+    for value in values:
+        parts += split_list(value)
+    return parts
+
+
+def add_numbered_columns(dct, column, values):
+    for i, value in enumerate(values, 1):
+        dct["{0} {1}".format(column, i)] = value
+
+
+if __name__ == "__main__":
+    main(ns_name="nb-ayer",
+         ns_address="https://www.nb-ayer.org/fake-schema#",
+         input_filename="newberry_ayer_original.xml",
+         output_filename="newberry_ayer.rdf")
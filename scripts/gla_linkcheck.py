@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import csv
+import sqlite3
+import sys
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from gla_utils import ABOUT_ATTRIB, COLLEX_NS, RDFS_NS, RESOURCE_ATTRIB, iter_rdf_items
+
+LINK_TAGS = {"{{{0}}}seeAlso".format(RDFS_NS): "rdfs:seeAlso",
+             "{{{0}}}thumbnail".format(COLLEX_NS): "collex:thumbnail"}
+
+
+def iter_links(source):
+    # (item rdf:about, field, url) for every seeAlso and thumbnail link,
+    # streamed out of the file one item at a time.
+    for item in iter_rdf_items(source):
+        about = item.get(ABOUT_ATTRIB)
+        for child in item.iterchildren(tag=tuple(LINK_TAGS)):
+            yield about, LINK_TAGS[child.tag], (child.get(RESOURCE_ATTRIB) or "").strip()
+
+
+class LinkCache:
+    # url -> last check result, kept in SQLite so reruns only recheck URLs
+    # whose result is older than the TTL.
+    def __init__(self, filename, ttl=7 * 24 * 3600):
+        self.ttl = ttl
+        self.db = sqlite3.connect(filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS links "
+                        "(url TEXT PRIMARY KEY, ok INTEGER, status INTEGER, error TEXT, checked_at REAL)")
+
+    def get(self, url):
+        row = self.db.execute("SELECT ok, status, error, checked_at FROM links WHERE url = ?", (url,)).fetchone()
+        if row is None or time.time() - row[3] > self.ttl:
+            return None
+        return {"ok": bool(row[0]), "status": row[1], "error": row[2]}
+
+    def put(self, url, result):
+        self.db.execute("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?)",
+                        (url, int(result["ok"]), result["status"], result["error"], time.time()))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class HostRateLimiter:
+    # Hands out request slots at most `rate` per second per host.
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = {}
+
+    async def wait(self, host):
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class LinkChecker:
+    def __init__(self, cache, concurrency=20, per_host_rate=5.0, timeout=30):
+        self.cache = cache
+        self.concurrency = concurrency
+        self.limiter = HostRateLimiter(per_host_rate)
+        self.timeout = timeout
+        self.checked = {}
+        self.requests = 0
+
+    async def check_links(self, links):
+        # Async generator of (about, field, url, result). Links are pulled
+        # from the RDF stream only as fast as they are checked, with at most
+        # 2 * concurrency in flight; each URL is fetched at most once per run.
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            pending = set()
+            for link in links:
+                if len(pending) >= self.concurrency * 2:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+                pending.add(asyncio.ensure_future(self.check_link(session, link)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+
+        self.cache.commit()
+
+    async def check_link(self, session, link):
+        about, field, url = link
+        if not url:
+            return about, field, url, {"ok": False, "status": None, "error": "missing URL"}
+
+        if url not in self.checked:
+            self.checked[url] = asyncio.ensure_future(self.check_url(session, url))
+        return about, field, url, await self.checked[url]
+
+    async def check_url(self, session, url):
+        result = self.cache.get(url)
+        if result is not None:
+            return result
+
+        # wait for the host's slot before taking a connection slot, so one
+        # rate-limited host can't hold up the links to every other host
+        await self.limiter.wait(urlsplit(url).netloc)
+        async with self.semaphore:
+            self.requests += 1
+            try:
+                async with session.head(url, allow_redirects=True) as response:
+                    status = response.status
+                if status in (405, 501):
+                    # some ContentDM servers refuse HEAD
+                    async with session.get(url, allow_redirects=True) as response:
+                        status = response.status
+                result = {"ok": status < 400, "status": status, "error": None}
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                result = {"ok": False, "status": None, "error": repr(e)}
+
+        self.cache.put(url, result)
+        return result
+
+
+async def check_files(filenames, checker, report):
+    # Writes one report row per broken link and returns (links, broken).
+    def links():
+        for filename in filenames:
+            for link in iter_links(filename):
+                yield link
+
+    total = broken = 0
+    async for about, field, url, result in checker.check_links(links()):
+        total += 1
+        if not result["ok"]:
+            broken += 1
+            report.writerow([about, field, url, result["status"] or "", result["error"] or ""])
+    return total, broken
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Check the rdfs:seeAlso and collex:thumbnail links in RDF files.")
+    parser.add_argument("rdf", nargs="+", help="Collex RDF files to check")
+    parser.add_argument("--cache", default="linkcheck.sqlite", help="SQLite file of previous results")
+    parser.add_argument("--ttl-days", type=float, default=7, help="recheck URLs older than this")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--per-host-rate", type=float, default=5.0, help="requests per second per host")
+    parser.add_argument("--report", help="CSV of broken links (default: stdout)")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = LinkCache(args.cache, ttl=args.ttl_days * 24 * 3600)
+    checker = LinkChecker(cache, concurrency=args.concurrency, per_host_rate=args.per_host_rate)
+
+    f = open(args.report, mode="w", newline="") if args.report else sys.stdout
+    try:
+        report = csv.writer(f)
+        report.writerow(["item", "field", "url", "status", "error"])
+        total, broken = asyncio.run(check_files(args.rdf, checker, report))
+    finally:
+        cache.close()
+        if f is not sys.stdout:
+            f.close()
+
+    sys.stderr.write("{0} links, {1} broken, {2} requests\n".format(total, broken, checker.requests))
@@ -0,0 +1,156 @@
+from array import array
+import json
+import math
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+clock = getattr(time, "perf_counter", time.time)
+
+PROFILE_ENV = "GLA_PROFILE"
+
+# Timings are counted in log-spaced buckets, each 5% wider than the one
+# before, from 0.1 microseconds up to about 1000 seconds
+BUCKET_MIN = 1e-7
+BUCKET_GROWTH = 1.05
+BUCKETS = int(math.ceil(math.log(1e3 / BUCKET_MIN) / math.log(BUCKET_GROWTH))) + 1
+
+# CollexValidator methods reported per rule
+RULE_METHODS = ("group_children",
+                "check_required_fields",
+                "check_for_role",
+                "check_discipline_terms",
+                "check_genre_terms",
+                "check_fields_that_can_only_have_one_instance",
+                "check_date_fields")
+
+
+def profiling_enabled():
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+class Profiler:
+    # Times pipeline stages and validator rules by replacing methods on the
+    # instances being profiled with timed wrappers. Nothing is wrapped
+    # unless a Profiler is used, so the pipeline pays nothing when it's off.
+    def __init__(self):
+        self.start = clock()
+        self.stages = {}
+        self.rules = {}
+
+    def instrument(self, obj, method_name, name, table=None):
+        method = getattr(obj, method_name)
+        timings = (self.stages if table is None else table).setdefault(name, Timings())
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings.add(clock() - start)
+
+        setattr(obj, method_name, timed)
+
+    def instrument_validator(self, validator):
+        self.instrument(validator, "validate_object", "validate")
+        for method_name in RULE_METHODS:
+            self.instrument(validator, method_name, method_name, self.rules)
+
+    def iterate(self, iterable, name):
+        # times every next() of iterable, i.e. reading and parsing
+        timings = self.stages.setdefault(name, Timings())
+        iterator = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                return
+            timings.add(clock() - start)
+            yield value
+
+    def call(self, name, func, *args, **kwargs):
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stages.setdefault(name, Timings()).add(clock() - start)
+
+    def report(self, records=None):
+        seconds = clock() - self.start
+        if records is None:
+            records = max([timings.calls for timings in self.stages.values()] or [0])
+        return {"records": records,
+                "seconds": seconds,
+                "records_per_sec": records / seconds if seconds else None,
+                "peak_rss_mb": peak_rss_mb(),
+                "stages": summarize(self.stages),
+                "rules": summarize(self.rules)}
+
+    def write_report(self, filename, records=None):
+        report = self.report(records)
+        with open(filename, mode="w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        return report
+
+
+class Timings:
+    # Call count, total and a fixed-size histogram of the durations of one
+    # stage or rule, so memory doesn't grow with the number of records.
+    # Percentiles are read off the histogram: they are at most 5% above the
+    # true value, and never above the slowest call.
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.maximum = 0.0
+        self.buckets = array("L", [0]) * BUCKETS
+
+    def add(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.buckets[bucket(seconds)] += 1
+
+    def percentile(self, percent):
+        # nearest-rank percentile, as the upper bound of its bucket; the
+        # last bucket has no upper bound
+        if not self.calls:
+            return 0.0
+        rank = max(1, int(-(-percent * self.calls // 100)))
+        seen = 0
+        for index, count in enumerate(self.buckets[:-1]):
+            seen += count
+            if seen >= rank:
+                return min(BUCKET_MIN * BUCKET_GROWTH ** index, self.maximum)
+        return self.maximum
+
+
+def bucket(seconds):
+    if seconds <= BUCKET_MIN:
+        return 0
+    return min(BUCKETS - 1, int(math.ceil(math.log(seconds / BUCKET_MIN) / math.log(BUCKET_GROWTH))))
+
+
+def summarize(table):
+    summary = {}
+    for name, timings in table.items():
+        summary[name] = {"calls": timings.calls,
+                         "seconds": timings.seconds,
+                         "p50_ms": timings.percentile(50) * 1000.0,
+                         "p99_ms": timings.percentile(99) * 1000.0}
+    return summary
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, kilobytes elsewhere
+        peak_rss /= 1024.0
+    return peak_rss / 1024.0
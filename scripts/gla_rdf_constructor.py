@@ -1,84 +1,520 @@
 from lxml import etree
 import csv
+import gzip
+import hashlib
+import json
+import os
 
-from gla.gla_utils import TagBuilder, CollexValidator
+from gla_utils import TagBuilder, CollexValidator
+from gla_dates import normalize_date
+from gla_headings import normalize_names, normalize_subjects
+from gla_profile import Profiler, profiling_enabled
 
+try:
+    unicode
+except NameError:
+    unicode = str
 
-def main(ns_name, ns_address, input_filename, output_filename):
+
+MANIFEST_VERSION = 2
+
+# (substring of the column name, field) pairs: every column whose name
+# contains the substring becomes that field of the item. Fields are the
+# TagBuilder.build_item() field names, "role:XXX" makes a role:XXX element.
+# An archive can override these with "columns" in its manifest entry.
+DEFAULT_COLUMNS = (("subject", "subject"),
+                   ("location", "subject"),
+                   ("creator", "role:CRE"),
+                   ("identifier", "identifier"),
+                   ("description", "alternative_title"),
+                   ("source", "source"))
+
+COLUMN_FIELDS = ("alternative_title", "identifier", "language", "source", "subject", "title")
+
+CACHE_SIZE = 10000
+COLUMN_CACHE = {}
+TYPE_CACHE = {}
+
+REQUIRED_COLUMNS = ("about_link", "thumb_link", "year_begin", "year_end", "date", "title", "source", "format", "type")
+
+
+def main(ns_name, ns_address, input_filename, output_filename, stream=False, incremental=False,
+         columns=DEFAULT_COLUMNS, shards=None, profile=None):
+    # shards: ShardWriter options (max_items, max_bytes, compress,
+    # pretty_print) to write numbered shards instead of one file.
+    # profile: write stage and rule timings to <output>.profile.json;
+    # defaults to on when GLA_PROFILE is set.
+    if incremental and (stream or shards is not None):
+        # the incremental build writes one file from cached item bytes
+        raise ValueError("incremental can't be combined with stream or shards")
     tb = TagBuilder(ns_name, ns_address)
-    tree = tb.root()
+    validator = CollexValidator(ns_name, ns_address)
+    store = None
+    if input_filename.endswith(".store"):
+        # a store built by gla_store is already mapped, so columns doesn't
+        # apply; imported here because gla_store imports this module
+        from gla_store import RecordMapper, RecordStore
+        rows = store = RecordStore(input_filename)
+        mapper = RecordMapper()
+    else:
+        rows = read_lists(input_filename)
+        mapper = csv_mapper(rows, ns_name, columns)
+
+    profiler = None
+    if profile or (profile is None and profiling_enabled()):
+        profiler = Profiler()
+        rows = profiler.iterate(rows, "read")
+        profiler.instrument(mapper, "build_item", "make_item_rdf")
+        profiler.instrument_validator(validator)
+
+    if incremental:
+        manifest_filename = output_filename + ".manifest.json"
+        manifest = load_manifest(manifest_filename)
+        with open(output_filename, mode="wb") as f:
+            errors, manifest = build_incremental(rows, tb, validator, f, manifest, mapper=mapper)
+        save_manifest(manifest_filename, manifest)
+        print(errors)
+
+    elif shards is not None:
+        items = (mapper.build_item(row, tb) for row in rows)
+        writer = ShardWriter(tb, output_filename, **shards)
+        if profiler is not None:
+            profiler.instrument(writer, "write", "serialize")
+        print(write_rdf_stream(items, tb, None, validator=validator, writer=writer))
+
+    elif stream:
+        items = (mapper.build_item(row, tb) for row in rows)
+        with open(output_filename, mode="wb") as f:
+            writer = RdfWriter(tb, f)
+            if profiler is not None:
+                profiler.instrument(writer, "write", "serialize")
+            print(write_rdf_stream(items, tb, f, validator=validator, writer=writer))
+
+    else:
+        tree = tb.root()
+        for row in rows:
+            tree.append(mapper.build_item(row, tb))
+
+        print(validator.validate_rdf(tree))
+
+        with open(output_filename, mode="wb") as f:
+            if profiler is not None:
+                f.write(profiler.call("serialize", serialize_rdf, tree))
+            else:
+                f.write(serialize_rdf(tree))
+
+    if profiler is not None:
+        profiler.write_report(output_filename + ".profile.json")
+    if store is not None:
+        store.close()
+
+
+def read_rows(input_filename):
     with open(input_filename, mode="r") as f:
         reader = csv.DictReader(f)
         for dct in reader:
             for key, value in dct.items():
-                dct[key] = value.decode("utf-8")
-            tree.append(make_item_rdf(dct, tb, ns_name=ns_name))
+                if isinstance(value, bytes):
+                    dct[key] = value.decode("utf-8")
+            yield dct
 
-    validator = CollexValidator(ns_name, ns_address)
-    print(validator.validate_rdf(tree))
 
-    with open(output_filename, mode="w") as f:
-        f.write(etree.tostring(tree, pretty_print=True, xml_declaration=True, encoding="utf-8"))
+def read_lists(input_filename):
+    # The header row first, then every row as a plain list.
+    with open(input_filename, mode="r") as f:
+        for row in csv.reader(f):
+            if row and isinstance(row[0], bytes):
+                row = [value.decode("utf-8") for value in row]
+            yield row
 
 
-def make_item_rdf(dct, tb, ns_name):
-    item = tb.item(weblink=dct["about_link"])
-    type_ = normalize_type(get_format_text(dct))
+def compile_columns(columns):
+    compiled = []
+    for pattern, field in columns:
+        role_type = None
+        if field.startswith("role:"):
+            field, role_type = "role", field[len("role:"):]
+        elif field not in COLUMN_FIELDS:
+            raise ValueError("unknown field {0!r} for columns matching {1!r}".format(field, pattern))
+        compiled.append((pattern, field, role_type))
+    return tuple(compiled)
 
-    # required fields
-    item.append(tb.seeAlso(weblink=dct["about_link"]))
-    item.append(tb.archive(ns_name))
-    item.append(tb.federation("GLA"))
-    item.append(tb.discipline("History"))
-    if type_ == "Map":
-        item.append(tb.discipline("Geography"))
-    item.append(tb.thumbnail(weblink=dct.get("thumb_link", "")))
 
-    if type_ == "Still Image":
-        item.append(tb.genre("Photograph"))
-    else:
-        item.append(tb.genre("Unspecified"))
+def match_column(name, columns):
+    # (field, role_type) pairs for one column, each field at most once.
+    matched = []
+    for pattern, field, role_type in columns:
+        if pattern in name and (field, role_type) not in matched:
+            matched.append((field, role_type))
+    return tuple(matched)
+
+
+def add_column_fields(fields, value, column_fields):
+    for field, role_type in column_fields:
+        if role_type:
+            for name in normalize_names(value):
+                fields.append(("role", (name, role_type)))
+        elif field == "subject":
+            for subject in normalize_subjects(value):
+                fields.append((field, subject))
+        elif field == "identifier":
+            fields.append((field, " ".join(value.split())))
+        else:
+            fields.append((field, value))
+
+
+class RowMapper:
+    # Compiled once from a CSV header: the columns the required fields are
+    # made from are looked up by index, and every other column is bound to
+    # its fields up front, so rows are plain lists and no column name is
+    # scanned per cell.
+    def __init__(self, fieldnames, ns_name, columns=DEFAULT_COLUMNS):
+        self.fieldnames = list(fieldnames)
+        self.ns_name = ns_name
+        self.columns = tuple(tuple(pair) for pair in columns)
+        self.about_index = self.fieldnames.index("about_link")
+        self.required = [(name, index) for index, name in enumerate(self.fieldnames) if name in REQUIRED_COLUMNS]
+
+        columns = compile_columns(columns)
+        self.dispatch = []
+        for index, name in enumerate(self.fieldnames):
+            column_fields = match_column(name, columns)
+            if column_fields:
+                self.dispatch.append((index, column_fields))
+
+    def about_link(self, row):
+        return row[self.about_index]
+
+    def row_key(self, row):
+        # same key as DictRowMapper.row_key() for the equivalent dict
+        return sorted(zip(self.fieldnames, self.pad(row)))
+
+    def pad(self, row):
+        if len(row) < len(self.fieldnames):
+            row = row + [""] * (len(self.fieldnames) - len(row))
+        return row
+
+    def fields(self, row):
+        row = self.pad(row)
+        fields = make_required_fields(dict((name, row[index]) for name, index in self.required), self.ns_name)
+        for index, column_fields in self.dispatch:
+            value = row[index].strip()
+            if value:
+                add_column_fields(fields, value, column_fields)
+        return fields
+
+    def build_item(self, row, tb):
+        return tb.build_item(row[self.about_index], self.fields(row))
+
+
+def csv_mapper(rows, ns_name, columns=DEFAULT_COLUMNS):
+    # RowMapper for the header of read_lists() rows. An empty file has no
+    # header and no rows, so it gets a mapper that is never called.
+    header = next(rows, None)
+    if header is None:
+        return DictRowMapper(ns_name, columns)
+    return RowMapper(header, ns_name, columns)
+
+
+class DictRowMapper:
+    # RowMapper's interface for dict rows whose keys vary from row to row,
+    # e.g. the records of gla_ingest.
+    def __init__(self, ns_name, columns=DEFAULT_COLUMNS):
+        self.ns_name = ns_name
+        self.columns = tuple(tuple(pair) for pair in columns)
+
+    def about_link(self, dct):
+        return dct["about_link"]
+
+    def row_key(self, dct):
+        return sorted(dct.items())
+
+    def fields(self, dct):
+        return make_item_fields(dct, self.ns_name, self.columns)
+
+    def build_item(self, dct, tb):
+        return tb.build_item(dct["about_link"], self.fields(dct))
+
+
+class RdfWriter:
+    # Writes an rdf:RDF document one item at a time. Each item is serialized
+    # inside an otherwise empty root and only its bytes are kept, so the
+    # output matches serialize_rdf() of the full tree without ever holding
+    # more than one item in memory.
+    def __init__(self, tb, f, pretty_print=True):
+        self.f = f
+        self.root = tb.root()
+        self.pretty_print = pretty_print
+        self.head, self.tail = split_rdf_document(tb, pretty_print)
+        self.count = 0
+
+    def item_bytes(self, item):
+        self.root.append(item)
+        document = serialize_rdf(self.root, self.pretty_print)
+        self.root.remove(item)
+        return document[len(self.head):len(document) - len(self.tail)]
+
+    def write(self, item):
+        self.write_bytes(self.item_bytes(item))
+
+    def write_bytes(self, item_bytes):
+        if self.count == 0:
+            self.f.write(self.head)
+        self.f.write(item_bytes)
+        self.count += 1
+
+    def close(self):
+        if self.count == 0:
+            self.f.write(serialize_rdf(self.root, self.pretty_print))
+        else:
+            self.f.write(self.tail)
+
 
-    item.append(make_date_tag(dct, tb))
+class ShardWriter:
+    # Spreads items over numbered shards next to output_filename
+    # (name.00001.rdf, name.00002.rdf, ...), each a complete rdf:RDF document
+    # with the same namespaces. A shard is closed before it would go over
+    # max_items or max_bytes (uncompressed); an item bigger than max_bytes
+    # gets a shard of its own. close() writes output_filename + ".index.json"
+    # listing every shard with its record count and the sha256 of the file.
+    def __init__(self, tb, output_filename, max_items=None, max_bytes=None, compress=False, pretty_print=True):
+        self.tb = tb
+        self.output_filename = output_filename
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.pretty_print = pretty_print
+        self.shards = []
+        self.writer = None
+        self.serializer = RdfWriter(tb, None, pretty_print)
 
-    item.append(tb.type_(type_))
-    item.append(tb.title(construct_title(dct)))
+    def write(self, item):
+        self.write_bytes(self.serializer.item_bytes(item))
+
+    def write_bytes(self, item_bytes):
+        if self.writer is not None and self.is_full(len(item_bytes)):
+            self.close_shard()
+        if self.writer is None:
+            self.open_shard()
+        self.writer.write_bytes(item_bytes)
+        self.size += len(item_bytes)
+
+    def is_full(self, item_size):
+        if self.max_items and self.writer.count >= self.max_items:
+            return True
+        return bool(self.max_bytes) and \
+            self.size + item_size + len(self.serializer.tail) > self.max_bytes
+
+    def open_shard(self):
+        root, extension = os.path.splitext(self.output_filename)
+        self.filename = "{0}.{1:05d}{2}".format(root, len(self.shards) + 1, extension)
+        if self.compress:
+            self.filename += ".gz"
+
+        self.file = HashingFile(open(self.filename, mode="wb"))
+        if self.compress:
+            # no name or timestamp in the header, so equal shards get equal checksums
+            f = gzip.GzipFile(filename="", mode="wb", fileobj=self.file, mtime=0)
+        else:
+            f = self.file
+        self.writer = RdfWriter(self.tb, f, self.pretty_print)
+        self.size = len(self.writer.head)
+
+    def close_shard(self):
+        self.writer.close()
+        if self.compress:
+            self.writer.f.close()
+        self.file.close()
+        self.shards.append({"file": os.path.basename(self.filename),
+                            "records": self.writer.count,
+                            "sha256": self.file.sha256.hexdigest()})
+        self.writer = None
+
+    def close(self):
+        if self.writer is None and not self.shards:
+            # no items: still write one (empty) shard
+            self.open_shard()
+        if self.writer is not None:
+            self.close_shard()
+
+        index = {"records": sum(shard["records"] for shard in self.shards),
+                 "compressed": self.compress,
+                 "shards": self.shards}
+        with open(self.output_filename + ".index.json", mode="w") as f:
+            json.dump(index, f, indent=2)
+        return index
+
+
+class HashingFile:
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def write_rdf_stream(items, tb, f, validator=None, writer=None):
+    errors = ""
+    if writer is None:
+        writer = RdfWriter(tb, f)
+
+    for item in items:
+        if validator is not None:
+            error_string = validator.validate_object(item)
+            if error_string:
+                errors += error_string + "\n"
+        writer.write(item)
+
+    writer.close()
+    return errors
+
+
+def build_incremental(rows, tb, validator, f, manifest, mapper=None):
+    # Only rows whose hash differs from the manifest go through the mapper
+    # and the validator; everything else is spliced in from the cached item
+    # bytes. Rows missing from the input simply drop out of the new manifest.
+    if mapper is None:
+        mapper = DictRowMapper(tb.namespace)
+    errors = ""
+    writer = RdfWriter(tb, f)
+    # the row hashes don't cover the columns mapping, so a new mapping
+    # rebuilds every item
+    columns = columns_digest(getattr(mapper, "columns", None))
+    cached_items = manifest.get("items", {}) if manifest.get("columns") == columns else {}
+    items = {}
+
+    for row in rows:
+        about_link = mapper.about_link(row)
+        row_hash = hash_row(mapper.row_key(row), tb)
+        entry = cached_items.get(about_link)
+
+        if entry is None or entry["hash"] != row_hash:
+            item = mapper.build_item(row, tb)
+            entry = {"hash": row_hash,
+                     "errors": validator.validate_object(item),
+                     "xml": writer.item_bytes(item).decode("utf-8")}
+
+        items[about_link] = entry
+        writer.write_bytes(entry["xml"].encode("utf-8"))
+        if entry["errors"]:
+            errors += entry["errors"] + "\n"
+
+    writer.close()
+    return errors, {"version": MANIFEST_VERSION, "columns": columns, "items": items}
+
+
+def hash_row(row_key, tb):
+    key = json.dumps([tb.namespace, tb.address, row_key])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def columns_digest(columns):
+    if columns is None:
+        return None
+    key = json.dumps([list(pair) for pair in columns])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest_filename):
+    if not os.path.exists(manifest_filename):
+        return {}
+    with open(manifest_filename, mode="r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_manifest(manifest_filename, manifest):
+    with open(manifest_filename, mode="w") as f:
+        json.dump(manifest, f)
+
+
+def split_rdf_document(tb, pretty_print=True):
+    root = tb.root()
+    root.append(etree.Comment("split"))
+    sentinel = b"  <!--split-->\n" if pretty_print else b"<!--split-->"
+    head, tail = serialize_rdf(root, pretty_print).split(sentinel)
+    return head, tail
+
+
+def serialize_rdf(root, pretty_print=True):
+    return etree.tostring(root, pretty_print=pretty_print, xml_declaration=True, encoding="utf-8")
+
+
+def make_item_rdf(dct, tb, ns_name):
+    return tb.build_item(dct["about_link"], make_item_fields(dct, ns_name))
+
+
+def make_item_fields(dct, ns_name, columns=DEFAULT_COLUMNS):
+    fields = make_required_fields(dct, ns_name)
 
     # optional fields
     for key, value in dct.items():
         value = value.strip()
         if not value:
             continue
-        if "subject" in key or "location" in key:
-            item.append(tb.subject(value))
-        if "creator" in key:
-            item.append(tb.role(value, "CRE"))
-        if "identifier" in key:
-            item.append(tb.identifier(" ".join(value.split())))
-        if "description" in key:
-            item.append(tb.alternative_title(value))
-        if "source" in key:
-            item.append(tb.source(value))
+        column_fields = COLUMN_CACHE.get((columns, key))
+        if column_fields is None:
+            if len(COLUMN_CACHE) >= CACHE_SIZE:
+                COLUMN_CACHE.clear()
+            column_fields = COLUMN_CACHE[(columns, key)] = match_column(key, compile_columns(columns))
+        add_column_fields(fields, value, column_fields)
+
+    return fields
 
 
-    return item
+def make_required_fields(dct, ns_name):
+    type_ = normalize_type(get_format_text(dct))
+
+    # required fields
+    fields = [("seeAlso", dct["about_link"]),
+              ("archive", ns_name),
+              ("federation", "GLA"),
+              ("discipline", "History")]
+    if type_ == "Map":
+        fields.append(("discipline", "Geography"))
+    fields.append(("thumbnail", dct.get("thumb_link", "")))
+
+    if type_ == "Still Image":
+        fields.append(("genre", "Photograph"))
+    else:
+        fields.append(("genre", "Unspecified"))
 
+    fields.append(make_date_field(dct))
 
-def make_date_tag(dct, tb):
+    fields.append(("type_", type_))
+    fields.append(("title", construct_title(dct)))
+    return fields
+
+
+def make_date_field(dct):
     year_begin = dct.get("year_begin", "")
     year_end = dct.get("year_end", "")
     if year_begin and year_end:
         string = "c. {}-{}".format(year_begin, year_end)
         formal_string = "{},{}".format(year_begin, year_end)
 
-        return tb.collex_date(label=string, value=formal_string)
+        return "collex_date", (string, formal_string)
 
     elif year_begin:
-        return tb.collex_date(label=year_begin, value=year_begin)
+        return "collex_date", (year_begin, year_begin)
     elif year_end:
-        return tb.collex_date(label=year_end, value=year_end)
-    else:
-        return tb.dc_date("Uncertain")
+        return "collex_date", (year_end, year_end)
+
+    # no hand-split years, try the free-text date instead
+    date = normalize_date(dct.get("date", ""))
+    if date is not None:
+        return "collex_date", date
+    return "dc_date", "Uncertain"
 
 def construct_title(dct):
     source = unicode(dct.get("source", "")).strip()
@@ -97,6 +533,16 @@ def get_format_text(dct):
 
 
 def normalize_type(string):
+    # format strings repeat heavily, so classify each distinct one once
+    type_ = TYPE_CACHE.get(string)
+    if type_ is None:
+        if len(TYPE_CACHE) >= CACHE_SIZE:
+            TYPE_CACHE.clear()
+        type_ = TYPE_CACHE[string] = classify_type(string)
+    return type_
+
+
+def classify_type(string):
     illustrations = ["illustration", "woodcut", "engraving", "etching"]
     books = ["book", "dictionar", "text"]
     string = string.lower()
@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+
+from gla_dates import date_range
+from gla_utils import ABOUT_ATTRIB, COLLEX_NS, DC_NS, DCTERMS_NS, ROLE_NS, VALUE_TAG, iter_rdf_items
+
+DC = "{{{0}}}".format(DC_NS)
+COLLEX = "{{{0}}}".format(COLLEX_NS)
+ROLE = "{{{0}}}".format(ROLE_NS)
+ALTERNATIVE_TAG = "{{{0}}}alternative".format(DCTERMS_NS)
+
+# full-text columns of record_text, in order
+TEXT_COLUMNS = ("title", "alternative_title", "subject", "creator", "identifier")
+# facet columns of records that search() can filter on
+FACET_COLUMNS = ("archive", "genre", "type")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, about TEXT UNIQUE NOT NULL,
+                                    archive TEXT, genre TEXT, type TEXT, date TEXT,
+                                    year_begin INTEGER, year_end INTEGER, hash TEXT);
+CREATE INDEX IF NOT EXISTS records_archive ON records (archive);
+CREATE INDEX IF NOT EXISTS records_genre ON records (genre);
+CREATE INDEX IF NOT EXISTS records_type ON records (type);
+CREATE INDEX IF NOT EXISTS records_year ON records (year_begin, year_end);
+CREATE VIRTUAL TABLE IF NOT EXISTS record_text USING fts5({0});
+""".format(", ".join(TEXT_COLUMNS))
+
+
+def item_record(item):
+    # The indexed columns of one item. Repeated fields are joined with a
+    # newline for the full-text columns and "; " for the facets.
+    def texts(tag):
+        return [" ".join(element.text.split()) for element in item.iterchildren(tag) if element.text]
+
+    date = item.find(DC + "date")
+    if date is not None:
+        value = date.find(".//" + VALUE_TAG)
+        date = (value.text if value is not None else date.text) or ""
+    years = date_range(date or "") or (None, None)
+
+    creators = []
+    for child in item.iterchildren():
+        if isinstance(child.tag, str) and child.tag.startswith(ROLE) and child.text:
+            creators.append(" ".join(child.text.split()))
+
+    return {"about": (item.get(ABOUT_ATTRIB) or "").strip(),
+            "archive": "; ".join(texts(COLLEX + "archive")),
+            "genre": "; ".join(texts(COLLEX + "genre")),
+            "type": "; ".join(texts(DC + "type")),
+            "date": (date or "").strip(),
+            "year_begin": years[0],
+            "year_end": years[1],
+            "title": "\n".join(texts(DC + "title")),
+            "alternative_title": "\n".join(texts(ALTERNATIVE_TAG)),
+            "subject": "\n".join(texts(DC + "subject")),
+            "creator": "\n".join(creators),
+            "identifier": "\n".join(texts(DC + "identifier"))}
+
+
+class SearchIndex:
+    # Items from Collex RDF files in SQLite: facets in `records`, keyed on
+    # rdf:about, and the searchable text in the FTS5 table `record_text`
+    # under the same rowid. Re-indexing a file only rewrites the items whose
+    # columns changed.
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+
+    def upsert(self, record):
+        # "inserted", "updated" or "unchanged"
+        digest = hashlib.sha1(json.dumps(record, sort_keys=True).encode("utf-8")).hexdigest()
+        row = self.db.execute("SELECT id, hash FROM records WHERE about = ?", (record["about"],)).fetchone()
+        if row is not None and row[1] == digest:
+            return "unchanged"
+
+        values = (record["archive"], record["genre"], record["type"], record["date"],
+                  record["year_begin"], record["year_end"], digest)
+        if row is None:
+            record_id = self.db.execute("INSERT INTO records (archive, genre, type, date, year_begin, year_end, hash, "
+                                        "about) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values + (record["about"],)).lastrowid
+        else:
+            record_id = row[0]
+            self.db.execute("UPDATE records SET archive = ?, genre = ?, type = ?, date = ?, year_begin = ?, "
+                            "year_end = ?, hash = ? WHERE id = ?", values + (record_id,))
+            self.db.execute("DELETE FROM record_text WHERE rowid = ?", (record_id,))
+        self.db.execute("INSERT INTO record_text (rowid, {0}) VALUES (?, {1})".format(
+            ", ".join(TEXT_COLUMNS), ", ".join("?" * len(TEXT_COLUMNS))),
+            (record_id,) + tuple(record[column] for column in TEXT_COLUMNS))
+        return "updated" if row is not None else "inserted"
+
+    def delete(self, about):
+        row = self.db.execute("SELECT id FROM records WHERE about = ?", (about,)).fetchone()
+        if row is None:
+            return False
+        self.db.execute("DELETE FROM record_text WHERE rowid = ?", row)
+        self.db.execute("DELETE FROM records WHERE id = ?", row)
+        return True
+
+    def index_file(self, filename, replace=False):
+        return self.index_files([filename], replace)
+
+    def index_files(self, filenames, replace=False):
+        # Upserts every item of the files in one transaction. With replace,
+        # items of the files' archives that aren't in any of the files are
+        # deleted, so the index matches a new release exactly; pass every
+        # shard of a release in one call.
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+        seen = set()
+        archives = set()
+        with self.db:
+            for filename in filenames:
+                for item in iter_rdf_items(filename):
+                    record = item_record(item)
+                    if not record["about"]:
+                        continue
+                    counts[self.upsert(record)] += 1
+                    seen.add(record["about"])
+                    archives.add(record["archive"])
+
+            if replace:
+                for archive in archives:
+                    for about, in self.db.execute("SELECT about FROM records WHERE archive = ?", (archive,)).fetchall():
+                        if about not in seen and self.delete(about):
+                            counts["deleted"] += 1
+        return counts
+
+    def search(self, query=None, limit=20, year_from=None, year_to=None, **facets):
+        # Records matching an FTS5 query (e.g. 'subject:"Indians of North
+        # America"' or 'sloan*') and/or facet values, best match first.
+        # Facets are keyword arguments named after FACET_COLUMNS; year_from
+        # and year_to keep records whose date range overlaps them.
+        conditions = []
+        parameters = []
+        if query:
+            conditions.append("record_text MATCH ?")
+            parameters.append(query)
+        for column, value in sorted(facets.items()):
+            if column not in FACET_COLUMNS:
+                raise ValueError("Unknown facet {0}".format(column))
+            if value is not None:
+                conditions.append("records.{0} = ?".format(column))
+                parameters.append(value)
+        if year_from is not None:
+            conditions.append("records.year_end >= ?")
+            parameters.append(year_from)
+        if year_to is not None:
+            conditions.append("records.year_begin <= ?")
+            parameters.append(year_to)
+
+        sql = ("SELECT records.about, records.archive, records.genre, records.type, records.date, record_text.title "
+               "FROM records JOIN record_text ON record_text.rowid = records.id")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY {0} LIMIT ?".format("bm25(record_text)" if query else "records.about")
+        parameters.append(limit)
+
+        columns = ("about", "archive", "genre", "type", "date", "title")
+        return [dict(zip(columns, row)) for row in self.db.execute(sql, parameters)]
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Full-text index of Collex RDF items in SQLite.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    index = subparsers.add_parser("index", help="add or update the items of RDF files")
+    index.add_argument("database")
+    index.add_argument("rdf", nargs="+")
+    index.add_argument("--replace", action="store_true",
+                       help="delete items of the files' archives that are in none of the files")
+
+    query = subparsers.add_parser("query", help="search the index")
+    query.add_argument("database")
+    query.add_argument("query", nargs="?", help="FTS5 query, e.g. 'subject:\"Indains\"'")
+    query.add_argument("--archive")
+    query.add_argument("--genre")
+    query.add_argument("--type")
+    query.add_argument("--from", dest="year_from", type=int)
+    query.add_argument("--to", dest="year_to", type=int)
+    query.add_argument("--limit", type=int, default=20)
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.command == "index":
+        search_index = SearchIndex(args.database)
+        try:
+            counts = search_index.index_files(args.rdf, replace=args.replace)
+            print("{0} files: {inserted} inserted, {updated} updated, {unchanged} unchanged, {deleted} deleted".format(
+                len(args.rdf), **counts))
+        finally:
+            search_index.close()
+
+    elif args.command == "query":
+        search_index = SearchIndex(args.database)
+        try:
+            results = search_index.search(args.query, limit=args.limit, year_from=args.year_from,
+                                          year_to=args.year_to, archive=args.archive, genre=args.genre,
+                                          type=args.type)
+        finally:
+            search_index.close()
+        for result in results:
+            print("\t".join([result["about"], result["archive"], result["date"], result["title"]]))
+
+    else:
+        parse_args(["--help"])
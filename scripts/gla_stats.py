@@ -0,0 +1,231 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import sys
+
+from gla_dates import date_range
+from gla_utils import COLLEX_NS, DC_NS, PREFIXES, ROLE_NS, VALUE_TAG, iter_rdf_items
+from gla_store import STORE_SUFFIX, iter_store_items
+
+ARCHIVE_TAG = "{{{0}}}archive".format(COLLEX_NS)
+DATE_TAG = "{{{0}}}date".format(DC_NS)
+ROLE_TAG_PREFIX = "{{{0}}}".format(ROLE_NS)
+
+# fields counted exactly: their vocabularies are closed or small
+FACETS = {"collex:genre": "genre",
+          "collex:discipline": "discipline",
+          "dc:type": "type",
+          "dc:language": "language"}
+# fields counted with a top-k sketch
+SKETCHES = {"dc:subject": "subject",
+            "role:CRE": "creator"}
+
+
+class TopK:
+    # Misra-Gries summary of the most frequent values in bounded memory.
+    # Values are counted exactly until there are 2 * capacity of them; then
+    # the (capacity + 1)-th largest count is subtracted from every count and
+    # values at zero are dropped. Reported counts are lower bounds and
+    # `error` is the total subtracted, so a value's true count is at most
+    # its reported count + error. Sketches merge by adding their counts.
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.error = 0
+
+    def add(self, value, count=1):
+        self.counts[value] = self.counts.get(value, 0) + count
+        if len(self.counts) >= 2 * self.capacity:
+            self.prune()
+
+    def merge(self, other):
+        self.error += other.error
+        for value, count in other.counts.items():
+            self.add(value, count)
+        return self
+
+    def prune(self):
+        ordered = sorted(self.counts.values(), reverse=True)
+        if len(ordered) <= self.capacity:
+            return
+        decrement = ordered[self.capacity]
+        self.error += decrement
+        self.counts = dict((value, count - decrement) for value, count in self.counts.items() if count > decrement)
+
+    def top(self, k):
+        return sorted(self.counts.items(), key=lambda pair: (-pair[1], pair[0]))[:k]
+
+
+class ArchiveStats:
+    # Everything the report says about one archive, built item by item.
+    # Counts are per item: an item with two subjects adds one to each.
+    def __init__(self, capacity=1000):
+        self.items = 0
+        self.fields = {}
+        self.facets = dict((name, {}) for name in FACETS.values())
+        self.facets["role"] = {}
+        self.sketches = dict((name, TopK(capacity)) for name in SKETCHES.values())
+        self.decades = {}
+        self.undated = 0
+
+    def add(self, item):
+        self.items += 1
+        seen = set()
+        dates = []
+        for child in item.iterchildren():
+            if not isinstance(child.tag, str):
+                continue
+            field = prefixed_name(child.tag)
+            seen.add(field)
+
+            if child.tag == DATE_TAG:
+                value = child.find(".//" + VALUE_TAG)
+                dates.append((value.text if value is not None else child.text) or "")
+                continue
+            text = " ".join((child.text or "").split())
+            if not text:
+                continue
+            if field in FACETS:
+                count(self.facets[FACETS[field]], text)
+            if field in SKETCHES:
+                self.sketches[SKETCHES[field]].add(text)
+            if child.tag.startswith(ROLE_TAG_PREFIX):
+                count(self.facets["role"], field[len("role:"):])
+
+        for field in seen:
+            count(self.fields, field)
+
+        decades = set()
+        for date in dates:
+            decades.update(date_decades(date))
+        if not decades:
+            self.undated += 1
+        for decade in decades:
+            count(self.decades, decade)
+
+    def merge(self, other):
+        self.items += other.items
+        self.undated += other.undated
+        merge_counts(self.fields, other.fields)
+        merge_counts(self.decades, other.decades)
+        for name, counts in other.facets.items():
+            merge_counts(self.facets.setdefault(name, {}), counts)
+        for name, sketch in other.sketches.items():
+            self.sketches[name].merge(sketch)
+        return self
+
+    def report(self, top=20):
+        items = float(self.items or 1)
+        return {"items": self.items,
+                "fill_rates": dict((field, round(n / items, 4)) for field, n in sorted(self.fields.items())),
+                "facets": dict((name, sorted_counts(counts)) for name, counts in self.facets.items()),
+                "top": dict((name, {"values": sketch.top(top), "error": sketch.error})
+                            for name, sketch in self.sketches.items()),
+                "decades": [[decade, n] for decade, n in sorted(self.decades.items())],
+                "undated": self.undated}
+
+
+def prefixed_name(tag):
+    namespace, local_name = tag[1:].split("}", 1) if tag.startswith("{") else ("", tag)
+    prefix = PREFIXES.get(namespace)
+    return "{0}:{1}".format(prefix, local_name) if prefix else tag
+
+
+def date_decades(date):
+    # decades covered by a collex:date rdf:value, e.g. "1944,1968" ->
+    # 1940, 1950, 1960; nothing for "Uncertain" or free text
+    years = date_range(date)
+    if years is None:
+        return []
+    return range(years[0] // 10 * 10, years[1] + 1, 10)
+
+
+def count(counts, key, n=1):
+    counts[key] = counts.get(key, 0) + n
+
+
+def merge_counts(counts, other):
+    for key, n in other.items():
+        count(counts, key, n)
+
+
+def sorted_counts(counts):
+    return [[value, n] for value, n in sorted(counts.items(), key=lambda pair: (-pair[1], pair[0]))]
+
+
+def file_stats(task):
+    # archive -> ArchiveStats for one RDF file or record store; items
+    # without a collex:archive are filed under the file name
+    filename, capacity = task
+    archives = {}
+    items = iter_store_items(filename) if filename.endswith(STORE_SUFFIX) else iter_rdf_items(filename)
+    for item in items:
+        archive = (item.findtext(ARCHIVE_TAG) or "").strip() or filename
+        stats = archives.get(archive)
+        if stats is None:
+            stats = archives[archive] = ArchiveStats(capacity)
+        stats.add(item)
+    return archives
+
+
+def corpus_stats(filenames, processes=None, capacity=1000):
+    # One streaming pass per file, files spread over worker processes, and
+    # the per-file results merged as they come back.
+    archives = {}
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(file_stats, [(filename, capacity) for filename in filenames]):
+            for archive, stats in result.items():
+                if archive in archives:
+                    archives[archive].merge(stats)
+                else:
+                    archives[archive] = stats
+    finally:
+        pool.close()
+        pool.join()
+    return archives
+
+
+def corpus_report(archives, top=20, capacity=1000):
+    total = ArchiveStats(capacity)
+    for stats in archives.values():
+        total.merge(stats)
+    return {"archives": dict((archive, stats.report(top)) for archive, stats in archives.items()),
+            "total": total.report(top)}
+
+
+def expand_patterns(patterns):
+    # shell globs aren't recursive everywhere, so "**" is expanded here
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        filenames += matches or [pattern]
+    return filenames
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Facet counts, fill rates and date histograms for Collex RDF files "
+                                                 "and record stores.")
+    parser.add_argument("rdf", nargs="+", help="RDF files, .store files or glob patterns, e.g. "
+                                               "'metadata/incorporated/**/*.rdf'")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--top", type=int, default=20, help="values listed for subjects and creators")
+    parser.add_argument("--capacity", type=int, default=1000, help="values kept by each top-k sketch")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    archives = corpus_stats(expand_patterns(args.rdf), args.processes, args.capacity)
+    report = corpus_report(archives, args.top, args.capacity)
+
+    f = open(args.output, mode="w") if args.output else sys.stdout
+    try:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    sys.stderr.write("{0} archives, {1} items\n".format(len(archives), report["total"]["items"]))
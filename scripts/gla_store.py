@@ -0,0 +1,350 @@
+from array import array
+import argparse
+import json
+import mmap
+import struct
+import sys
+
+from gla_utils import TagBuilder, CollexValidator
+from gla_rdf_constructor import DEFAULT_COLUMNS, DictRowMapper, csv_mapper, read_lists, write_rdf_stream
+from gla_ingest import iter_records
+
+MAGIC = b"GLASTORE"
+STORE_VERSION = 1
+STORE_SUFFIX = ".store"
+
+# Number of strings in each field's value: collex_date values are
+# (label, value) pairs, everything else is a single string.
+FIELD_PARTS = {"collex_date": 2}
+
+
+class RecordStore:
+    # Read side of the columnar store: the (about_link, fields) records
+    # that TagBuilder.build_item() takes, loaded by memory-mapping the file.
+    #
+    # Every field is stored as one column per part: an offset array (record
+    # -> range of codes), the codes, and a dictionary of the distinct
+    # strings, so "archive" or "genre" cost 4 bytes a record. The order of
+    # fields within a record is kept as a dictionary-encoded "shape", the
+    # sequence of field keys ("subject", "role:CRE", ...). Strings are
+    # decoded once per column and shared by every record that uses them.
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, mode="rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.views = []
+
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError("{0} is not a record store".format(filename))
+        header_length = struct.unpack("<I", self.map[len(MAGIC):len(MAGIC) + 4])[0]
+        start = len(MAGIC) + 4
+        self.header = json.loads(self.map[start:start + header_length].decode("utf-8"))
+        self.base = data_offset(header_length)
+        if self.header["version"] != STORE_VERSION:
+            raise ValueError("{0} is a version {1} store".format(filename, self.header["version"]))
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError("{0} was written on a {1}-endian machine".format(filename, self.header["byteorder"]))
+
+        self.ns_name = self.header["ns_name"]
+        self.ns_address = self.header["ns_address"]
+        self.count = self.header["records"]
+        self.shapes = [tuple(shape) for shape in self.header["shapes"]]
+        self.shape_codes = self.section(self.header["shape_codes"])
+        self.columns = {}
+        for name, sections in self.header["columns"].items():
+            self.columns[name] = StoreColumn(self.section(sections["offsets"]),
+                                             self.section(sections["codes"]),
+                                             self.section(sections["dictionary_offsets"]),
+                                             self.section(sections["dictionary"], "B"))
+
+    def section(self, position, format="I"):
+        offset, length = position
+        view = memoryview(self.map)[self.base + offset:self.base + offset + length]
+        if format != "B":
+            view = view.cast(format)
+        self.views.append(view)
+        return view
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.record(index)
+
+    def record(self, index):
+        # (about_link, fields) for one record
+        fields = []
+        cursors = {}
+        for key in self.shapes[self.shape_codes[index]]:
+            position = cursors.get(key, 0)
+            cursors[key] = position + 1
+            parts = [self.columns[name].value(index, position) for name in column_names(key)]
+
+            if key.startswith("role:"):
+                fields.append(("role", (parts[0], key[len("role:"):])))
+            elif len(parts) == 1:
+                fields.append((key, parts[0]))
+            else:
+                fields.append((key, tuple(parts)))
+        return self.columns["about"].value(index, 0), fields
+
+    def value_counts(self, key, part=0):
+        # value -> number of occurrences of a field, counted on the codes
+        # without decoding a string per record.
+        column = self.columns.get(column_names(key)[part])
+        if column is None:
+            return {}
+        counts = array("I", [0]) * len(column.dictionary_offsets)
+        for code in column.codes:
+            counts[code] += 1
+        return dict((column.string(code), count) for code, count in enumerate(counts) if count)
+
+    def close(self):
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StoreColumn:
+    def __init__(self, offsets, codes, dictionary_offsets, dictionary):
+        self.offsets = offsets
+        self.codes = codes
+        self.dictionary_offsets = dictionary_offsets
+        self.dictionary = dictionary
+        self.strings = [None] * (len(dictionary_offsets) - 1)
+
+    def value(self, index, position):
+        return self.string(self.codes[self.offsets[index] + position])
+
+    def string(self, code):
+        string = self.strings[code]
+        if string is None:
+            start, end = self.dictionary_offsets[code], self.dictionary_offsets[code + 1]
+            string = self.strings[code] = bytes(self.dictionary[start:end]).decode("utf-8")
+        return string
+
+
+class StoreWriter:
+    # Collects (about_link, fields) records column by column and writes
+    # them out in the layout RecordStore reads.
+    def __init__(self, ns_name, ns_address):
+        self.ns_name = ns_name
+        self.ns_address = ns_address
+        self.count = 0
+        self.shapes = {}
+        self.shape_codes = array("I")
+        self.columns = {}
+
+    def add(self, about_link, fields):
+        index = self.count
+        self.count += 1
+        self.column("about").add(index, about_link)
+
+        shape = []
+        for field, value in fields:
+            if field == "role":
+                value, role_type = value
+                field = "role:" + role_type
+            shape.append(field)
+
+            names = column_names(field)
+            if len(names) == 1:
+                self.column(names[0]).add(index, value)
+            else:
+                for name, part in zip(names, value):
+                    self.column(name).add(index, part)
+
+        shape = tuple(shape)
+        self.shape_codes.append(self.shapes.setdefault(shape, len(self.shapes)))
+
+    def column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = ColumnWriter()
+        return column
+
+    def write(self, f):
+        sections = []
+        header = {"version": STORE_VERSION,
+                  "byteorder": sys.byteorder,
+                  "ns_name": self.ns_name,
+                  "ns_address": self.ns_address,
+                  "records": self.count,
+                  "shapes": [list(shape) for shape, code in sorted(self.shapes.items(), key=lambda pair: pair[1])],
+                  "shape_codes": self.add_section(sections, self.shape_codes.tobytes()),
+                  "columns": {}}
+        for name, column in sorted(self.columns.items()):
+            column.extend(self.count)
+            header["columns"][name] = {
+                "offsets": self.add_section(sections, column.offsets.tobytes()),
+                "codes": self.add_section(sections, column.codes.tobytes()),
+                "dictionary_offsets": self.add_section(sections, column.dictionary_offsets.tobytes()),
+                "dictionary": self.add_section(sections, b"".join(column.dictionary))}
+
+        header_bytes = json.dumps(header).encode("utf-8")
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_offset(len(header_bytes)) - len(MAGIC) - 4 - len(header_bytes)))
+        for data in sections:
+            f.write(data)
+            f.write(b"\0" * (align(len(data)) - len(data)))
+
+    @staticmethod
+    def add_section(sections, data):
+        offset = sum(align(len(section)) for section in sections)
+        sections.append(data)
+        return [offset, len(data)]
+
+
+class ColumnWriter:
+    def __init__(self):
+        self.offsets = array("I", [0])
+        self.codes = array("I")
+        self.codes_by_string = {}
+        self.dictionary = []
+        self.dictionary_offsets = array("I", [0])
+
+    def add(self, index, string):
+        self.extend(index + 1)
+        code = self.codes_by_string.get(string)
+        if code is None:
+            code = self.codes_by_string[string] = len(self.dictionary)
+            data = string.encode("utf-8")
+            self.dictionary.append(data)
+            self.dictionary_offsets.append(self.dictionary_offsets[-1] + len(data))
+        self.codes.append(code)
+        self.offsets[-1] = len(self.codes)
+
+    def extend(self, records):
+        # records this column has no values for get an empty range
+        while len(self.offsets) < records + 1:
+            self.offsets.append(len(self.codes))
+
+
+def column_names(key):
+    parts = FIELD_PARTS.get(key, 1)
+    if parts == 1:
+        return (key,)
+    return tuple("{0}.{1}".format(key, part) for part in range(parts))
+
+
+def align(length, boundary=8):
+    return (length + boundary - 1) // boundary * boundary
+
+
+def data_offset(header_length):
+    # sections start at the first 8-byte boundary after the header and their
+    # offsets are relative to that
+    return align(len(MAGIC) + 4 + header_length)
+
+
+def build_store(ns_name, ns_address, input_filename, output_filename, columns=DEFAULT_COLUMNS):
+    # Maps a refined CSV or an XML export into a store, the same way the
+    # constructor maps it into items.
+    writer = StoreWriter(ns_name, ns_address)
+    if input_filename.endswith(".csv"):
+        rows = read_lists(input_filename)
+        mapper = csv_mapper(rows, ns_name, columns)
+    else:
+        rows = iter_records(input_filename)
+        mapper = DictRowMapper(ns_name, columns)
+
+    for row in rows:
+        writer.add(mapper.about_link(row), mapper.fields(row))
+    with open(output_filename, mode="wb") as f:
+        writer.write(f)
+    return writer.count
+
+
+class RecordMapper:
+    # RowMapper's interface for (about_link, fields) records from a store.
+    def about_link(self, record):
+        return record[0]
+
+    def row_key(self, record):
+        return [record[0], record[1]]
+
+    def fields(self, record):
+        return record[1]
+
+    def build_item(self, record, tb):
+        return tb.build_item(record[0], record[1])
+
+
+def store_to_rdf(store, output_filename, validator=None):
+    tb = TagBuilder(store.ns_name, store.ns_address)
+    items = (tb.build_item(about_link, fields) for about_link, fields in store)
+    with open(output_filename, mode="wb") as f:
+        return write_rdf_stream(items, tb, f, validator=validator)
+
+
+def validate_store(store):
+    return CollexValidator(store.ns_name, store.ns_address).validate_store(store)
+
+
+def iter_store_items(filename):
+    # The store's records built into items, like iter_rdf_items() for RDF
+    with RecordStore(filename) as store:
+        tb = TagBuilder(store.ns_name, store.ns_address)
+        for about_link, fields in store:
+            yield tb.build_item(about_link, fields)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Build, inspect and convert columnar record stores.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    build = subparsers.add_parser("build", help="map a refined CSV or XML export into a store")
+    build.add_argument("ns_name")
+    build.add_argument("ns_address")
+    build.add_argument("input")
+    build.add_argument("output")
+
+    rdf = subparsers.add_parser("rdf", help="write the store out as Collex RDF")
+    rdf.add_argument("store")
+    rdf.add_argument("output")
+
+    validate = subparsers.add_parser("validate", help="validate every record of the store")
+    validate.add_argument("store")
+
+    info = subparsers.add_parser("info", help="list the store's columns")
+    info.add_argument("store")
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.command == "build":
+        print("{0} records".format(build_store(args.ns_name, args.ns_address, args.input, args.output)))
+
+    elif args.command == "rdf":
+        with RecordStore(args.store) as store:
+            print(store_to_rdf(store, args.output, CollexValidator(store.ns_name, store.ns_address)))
+
+    elif args.command == "validate":
+        with RecordStore(args.store) as store:
+            errors = validate_store(store)
+        sys.stdout.write(errors)
+        if errors:
+            sys.exit(1)
+
+    elif args.command == "info":
+        with RecordStore(args.store) as store:
+            print("{0} records, {1} shapes".format(len(store), len(store.shapes)))
+            for name, column in sorted(store.columns.items()):
+                print("{0:<24} {1:>10} values {2:>10} distinct".format(name, len(column.codes), len(column.strings)))
+
+    else:
+        parse_args(["--help"])
@@ -1,26 +1,124 @@
 import datetime
+from io import BytesIO
 from lxml import etree
+import mmap
+import multiprocessing
 import re
 
+DC_NS = "http://purl.org/dc/elements/1.1/"
+DCTERMS_NS = "http://purl.org/dc/terms/"
+RDF_NS = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDFS_NS = "http://www.w3.org/2000/01/rdf-schema#"
+ROLE_NS = "http://www.loc.gov/loc.terms/relators/"
+COLLEX_NS = "http://www.collex.org/schema#"
+
+# namespace -> the prefix Collex RDF uses for it
+PREFIXES = {DC_NS: "dc",
+            DCTERMS_NS: "dcterms",
+            RDF_NS: "rdf",
+            RDFS_NS: "rdfs",
+            ROLE_NS: "role",
+            COLLEX_NS: "collex"}
+
+RDF_TAG = "{{{0}}}RDF".format(RDF_NS)
+ABOUT_ATTRIB = "{{{0}}}about".format(RDF_NS)
+RESOURCE_ATTRIB = "{{{0}}}resource".format(RDF_NS)
+VALUE_TAG = "{{{0}}}value".format(RDF_NS)
+
+# CONTENTdm item links in their two forms; the groups are scheme, host,
+# collection and item id
+CONTENTDM_REGEXES = [re.compile(r"^(https?)://([^/:]+)(?::\d+)?/cdm/ref/collection/([^/]+)/id/(\d+)"),
+                     re.compile(r"^(https?)://([^/:]+)(?::\d+)?/u\?/([^,]+),(\d+)")]
+
+# bytes of an RDF file per parallel validation job
+CHUNK_BYTES = 1 << 20
+# bytes read to find the rdf:RDF element and its first item
+PROBE_BYTES = 1 << 16
+
 
 class TagBuilder:
     def __init__(self, namespace, address):
         self.namespace = namespace
         self.address = address
 
-        self.ns = {"dc": "http://purl.org/dc/elements/1.1/",
-                   "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+        self.ns = {"dc": DC_NS,
+                   "rdfs": RDFS_NS,
                    "foaf": "http://xmlns.com/foaf/0.1/",
                    "xsd": "http://www.w3.org/2001/XMLSchema#",
                    "owl": "http://www.w3.org/2002/07/owl#",
-                   "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
-                   "role": "http://www.loc.gov/loc.terms/relators/",
-                   "collex": "http://www.collex.org/schema#",
-                   "dcterms": "http://purl.org/dc/terms/",
+                   "rdf": RDF_NS,
+                   "role": ROLE_NS,
+                   "collex": COLLEX_NS,
+                   "dcterms": DCTERMS_NS,
                    self.namespace: self.address}
 
+        self.clark_tags = {}
+        self.resource_attrib = self.clark_tag("rdf", "resource")
+
+        # field name -> (kind, Clark tag) for build_item(); each entry mirrors
+        # the per-field method of the same name below.
+        self.templates = {"alternative_title": ("text", self.clark_tag("dcterms", "alternative")),
+                          "archive": ("text", self.clark_tag("collex", "archive")),
+                          "collex_date": ("collex_date", self.clark_tag("dc", "date")),
+                          "dc_date": ("text", self.clark_tag("dc", "date")),
+                          "discipline": ("text", self.clark_tag("collex", "discipline")),
+                          "federation": ("text", self.clark_tag("collex", "federation")),
+                          "genre": ("text", self.clark_tag("collex", "genre")),
+                          "identifier": ("text", self.clark_tag("dc", "identifier")),
+                          "language": ("text", self.clark_tag("dc", "language")),
+                          "role": ("role", None),
+                          "seeAlso": ("resource", self.clark_tag("rdfs", "seeAlso")),
+                          "source": ("text", self.clark_tag("dc", "source")),
+                          "subject": ("text", self.clark_tag("dc", "subject")),
+                          "thumbnail": ("resource", self.clark_tag("collex", "thumbnail")),
+                          "title": ("text", self.clark_tag("dc", "title")),
+                          "type_": ("text", self.clark_tag("dc", "type"))}
+        self.collex_date_tags = (self.clark_tag("collex", "date"),
+                                 self.clark_tag("rdfs", "label"),
+                                 self.clark_tag("rdf", "value"))
+
+    def clark_tag(self, ns_key, tag_name):
+        key = (ns_key, tag_name)
+        tag = self.clark_tags.get(key)
+        if tag is None:
+            tag = self.clark_tags[key] = "{{{0}}}{1}".format(self.ns[ns_key], tag_name)
+        return tag
+
+    def build_item(self, weblink, fields):
+        # Builds a whole item in one call from (field name, value) pairs, where
+        # role values are (text, role_type) and collex_date values are
+        # (label, value). Same output as appending the per-field methods.
+        item = self.item(weblink)
+        sub_element = etree.SubElement
+
+        for field, value in fields:
+            kind, tag = self.templates[field]
+            if kind == "text":
+                e = sub_element(item, tag)
+                if value:
+                    e.text = value
+            elif kind == "resource":
+                sub_element(item, tag).set(self.resource_attrib, value)
+            elif kind == "role":
+                text, role_type = value
+                e = sub_element(item, self.clark_tag("role", role_type.upper()))
+                if text:
+                    e.text = text
+            else:
+                label, date_value = value
+                date_tag, label_tag, value_tag = self.collex_date_tags
+                collex_tag = sub_element(sub_element(item, tag), date_tag)
+                e = sub_element(collex_tag, label_tag)
+                if label:
+                    e.text = label
+                e = sub_element(collex_tag, value_tag)
+                if date_value:
+                    e.text = date_value
+
+        return item
+
     def build_ns_tag(self, ns_key, tag_name, attrib=tuple(), text=""):
-        e = etree.Element("{{{0}}}{1}".format(self.ns[ns_key], tag_name))
+        e = etree.Element(self.clark_tag(ns_key, tag_name))
         if text:
             e.text = text
         if attrib:
@@ -103,12 +201,14 @@ class ValidationException(Exception):
 
 class CollexValidator:
     def __init__(self, local_ns, local_ns_address):
-        self.ns = {"dc": "http://purl.org/dc/elements/1.1/",
-                   "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
-                   "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
-                   "role": "http://www.loc.gov/loc.terms/relators/",
-                   "collex": "http://www.collex.org/schema#",
-                   "dcterms": "http://purl.org/dc/terms/",
+        self.local_ns = local_ns
+        self.local_ns_address = local_ns_address
+        self.ns = {"dc": DC_NS,
+                   "rdfs": RDFS_NS,
+                   "rdf": RDF_NS,
+                   "role": ROLE_NS,
+                   "collex": COLLEX_NS,
+                   "dcterms": DCTERMS_NS,
                    local_ns: local_ns_address}
 
         self.roles = ["AUT", "EDT", "PBL", "TRL", "CRE", "ETR", "EGR",
@@ -196,75 +296,237 @@ class CollexValidator:
                                  "Science",
                                  "Theater Studies"]
 
-    def validate_rdf(self, tree):
+        self.item_schema = None
+
+        self.dc_date_tag = self.clark_tag("dc:date")
+        self.genre_tag = self.clark_tag("collex:genre")
+        self.discipline_tag = self.clark_tag("collex:discipline")
+        self.label_tag = self.clark_tag("rdfs:label")
+        self.value_tag = self.clark_tag("rdf:value")
+        self.compile_rules()
+
+    def validate_rdf(self, tree, schema=False):
+        # schema: check each item against the RELAX NG schema from
+        # compile_schema() first, and run the Python checks only on the items
+        # that fail it; items that pass only have their dates checked. The
+        # report is the same. It is off by default: on the archives under
+        # metadata/ it takes two to three times as long as the Python checks.
+        if schema and tree.xpath("boolean(//comment() | //processing-instruction())"):
+            # the schema reads text across comments, the checks stop at them
+            schema = False
+        if schema and self.item_schema is None:
+            self.item_schema = etree.RelaxNG(self.compile_schema())
+
         errors = ""
         for item in tree.xpath("//rdf:RDF", namespaces=self.ns)[0].iterchildren():
+            if schema and self.item_schema.validate(item):
+                error_string = ""
+                for date in item.iterchildren(self.dc_date_tag):
+                    error_string += self.validate_date(date)
+            else:
+                error_string = self.validate_object(item)
+            if error_string:
+                errors += error_string + "\n"
+        return errors
+
+    def validate_rdf_file(self, source):
+        errors = ""
+        for error_string in self.iter_rdf_file_errors(source):
+            errors += error_string + "\n"
+        return errors
+
+    def iter_rdf_file_errors(self, source):
+        for item in iter_rdf_items(source):
             error_string = self.validate_object(item)
+            if error_string:
+                yield error_string
+
+    def validate_rdf_parallel(self, source, processes=None, chunk_bytes=CHUNK_BYTES):
+        return self.validate_rdf_files_parallel([source], processes, chunk_bytes)[0][1]
+
+    def validate_rdf_files_parallel(self, sources, processes=None, chunk_bytes=CHUNK_BYTES):
+        # Every file is cut into byte ranges of whole items, about
+        # chunk_bytes each; the workers read, parse and validate their own
+        # range, so the parent only looks for item start tags. imap() hands
+        # results back in submission order, so each file's report is in
+        # document order, exactly as the serial validator.
+        jobs = ((index, self.local_ns, self.local_ns_address, job)
+                for index, source in enumerate(sources)
+                for job in iter_range_jobs(source, chunk_bytes))
+
+        reports = [""] * len(sources)
+        pool = multiprocessing.Pool(processes)
+        try:
+            for index, errors in pool.imap(validate_range, jobs):
+                reports[index] += errors
+        finally:
+            pool.close()
+            pool.join()
+
+        return list(zip(sources, reports))
+
+    def validate_store(self, store):
+        # (about_link, fields) records, e.g. a gla_store.RecordStore, built
+        # into items one at a time and validated; nothing is parsed.
+        tb = TagBuilder(self.local_ns, self.local_ns_address)
+        errors = ""
+        for about_link, fields in store:
+            error_string = self.validate_object(tb.build_item(about_link, fields))
             if error_string:
                 errors += error_string + "\n"
         return errors
 
     def validate_object(self, item):
         error_string = ""
+        children = self.group_children(item)
 
-        error_string += self.check_required_fields(item)
-        error_string += self.check_for_role(item)
-        error_string += self.check_discipline_terms(item)
-        error_string += self.check_genre_terms(item)
-        error_string += self.check_fields_that_can_only_have_one_instance(item)
-        error_string += self.check_date_fields(item)
+        error_string += self.check_required_fields(item, children)
+        error_string += self.check_for_role(item, children)
+        error_string += self.check_discipline_terms(item, children)
+        error_string += self.check_genre_terms(item, children)
+        error_string += self.check_fields_that_can_only_have_one_instance(item, children)
+        error_string += self.check_date_fields(item, children)
 
         return error_string
 
-    def check_date_fields(self, item):
+    def compile_schema(self):
+        # RELAX NG for one item of an rdf:RDF document, built from the same
+        # rule lists as the check_* methods. An item needs its required fields
+        # at least once, its single fields at most once, at least one known
+        # role, genre/discipline terms from their lists and the collex:date
+        # shape inside dc:date. Date values are left to validate_date().
+        def named(field, *content):
+            prefix, local_name = field.split(":", 1)
+            return rng("element", *content, name=local_name, ns=self.ns[prefix])
+
+        def name(field):
+            prefix, local_name = field.split(":", 1)
+            return rng("name", local_name, ns=self.ns[prefix])
+
+        def any_attributes():
+            return rng("zeroOrMore", rng("attribute", rng("anyName")))
+
+        def terms(field, values):
+            return named(field, any_attributes(),
+                         rng("choice", *[rng("value", value, type="string") for value in sorted(values)]))
+
+        roles = ["role:" + role for role in sorted(set(self.roles))]
+        fields = list(self.required_fields)
+        fields += [field for field in self.single_fields if field not in fields]
+
+        patterns = [rng("oneOrMore", rng("choice", *[named(role, rng("ref", name="any")) for role in roles]))]
+        for field in fields:
+            if field == "collex:genre":
+                element = terms(field, self.genre_set)
+            elif field == "collex:discipline":
+                element = terms(field, self.discipline_set)
+            elif field == "dc:date":
+                collex_date = named("collex:date", any_attributes(),
+                                    rng("interleave",
+                                        named("rdfs:label", any_attributes(), rng("text")),
+                                        named("rdf:value", any_attributes(), rng("text"))))
+                element = named(field, any_attributes(), rng("choice", rng("text"), collex_date))
+            else:
+                element = named(field, rng("ref", name="any"))
+
+            if field not in self.required_fields:
+                element = rng("optional", element)
+            elif field not in self.single_fields:
+                element = rng("oneOrMore", element)
+            patterns.append(element)
+
+        # anything the rules don't mention may appear any number of times
+        patterns.append(rng("zeroOrMore",
+                            rng("element",
+                                rng("anyName", rng("except", *[name(field) for field in fields + roles])),
+                                rng("ref", name="any"))))
+
+        item = rng("element", rng("anyName"), any_attributes(), rng("mixed", rng("interleave", *patterns)))
+        any_content = rng("zeroOrMore", rng("choice",
+                                             rng("attribute", rng("anyName")),
+                                             rng("text"),
+                                             rng("element", rng("anyName"), rng("ref", name="any"))))
+        return etree.ElementTree(rng("grammar", rng("start", item), rng("define", any_content, name="any")))
+
+    def group_children(self, item):
+        # One pass over the item's children, grouped by Clark-notation tag.
+        # The check_* methods below read their counts from this instead of
+        # running an XPath query per field.
+        children = {}
+        for child in item.iterchildren(tag=etree.Element):
+            children.setdefault(child.tag, []).append(child)
+        return children
+
+    def clark_tag(self, tagname):
+        prefix, local_name = tagname.split(":", 1)
+        return "{{{0}}}{1}".format(self.ns[prefix], local_name)
+
+    def compile_rules(self):
+        self.required_tags = [(field, self.clark_tag(field)) for field in self.required_fields]
+        self.single_tags = [(field, self.clark_tag(field)) for field in self.single_fields]
+        self.role_tags = frozenset(self.clark_tag("role:{}".format(role)) for role in self.roles)
+        self.genre_set = frozenset(self.genre_terms)
+        self.discipline_set = frozenset(self.discipline_terms)
+
+    def check_date_fields(self, item, children=None):
+        if children is None:
+            children = self.group_children(item)
+
         error_string = ""
-        for date in self.get_child_tags(tagname="dc:date", parent=item):
+        for date in children.get(self.dc_date_tag, ()):
             error_string += self.validate_date(date)
         return error_string
 
-    def check_fields_that_can_only_have_one_instance(self, item):
+    def check_fields_that_can_only_have_one_instance(self, item, children=None):
+        if children is None:
+            children = self.group_children(item)
+
         error_string = ""
-        for field in self.single_fields:
-            if len(self.get_child_tags(tagname=field, parent=item)) > 1:
+        for field, tag in self.single_tags:
+            if len(children.get(tag, ())) > 1:
                 error_string += "Too many {} fields -- can only be one".format(field)
         return error_string
 
-    def check_required_fields(self, item):
+    def check_required_fields(self, item, children=None):
+        if children is None:
+            children = self.group_children(item)
+
         error_string = ""
-        for field in self.required_fields:
-            if len(self.get_child_tags(tagname=field, parent=item)) == 0:
+        for field, tag in self.required_tags:
+            if tag not in children:
                 error_string += "Required field {} is missing".format(field)
         return error_string
 
-    def check_for_role(self, item):
-        error_string = ""
-        roles = []
-        for role in self.roles:
-            roles += self.get_child_tags(tagname="role:{}".format(role), parent=item)
+    def check_for_role(self, item, children=None):
+        if children is None:
+            children = self.group_children(item)
 
-        if not roles:
+        error_string = ""
+        if self.role_tags.isdisjoint(children):
             error_string = "At least one role is required"
 
         return error_string
 
-    def check_discipline_terms(self, item):
+    def check_discipline_terms(self, item, children=None):
+        if children is None:
+            children = self.group_children(item)
+
         error_string = ""
-        discipline_tags = self.get_child_tags(tagname="collex:discipline", parent=item)
-        for tag in discipline_tags:
-            if not any([tag.text == discipline for discipline in self.discipline_terms]):
+        for tag in children.get(self.discipline_tag, ()):
+            if tag.text not in self.discipline_set:
                 error_string += "{} is not a valid discipline term".format(tag.text)
         return error_string
 
-    def check_genre_terms(self, item):
+    def check_genre_terms(self, item, children=None):
+        if children is None:
+            children = self.group_children(item)
+
         error_string = ""
-        genre_tags = self.get_child_tags(tagname="collex:genre", parent=item)
-        for tag in genre_tags:
-            if not any([tag.text == genre for genre in self.genre_terms]):
+        for tag in children.get(self.genre_tag, ()):
+            if tag.text not in self.genre_set:
                 error_string += "{} is not a valid genre term".format(tag.text)
         return error_string
 
-    # TODO: write tests for disciplines and genres
-
     def get_child_tags(self, tagname, parent):
         return parent.xpath("{}".format(tagname), namespaces=self.ns)
 
@@ -296,13 +558,14 @@ class CollexValidator:
         if len(collex_date_element) != 2:
             return "Collex date element does not have the proper single rdfs:label and single rdf:value field"
 
-        if len(collex_date_element.xpath("rdfs:label", namespaces=self.ns)) != 1:
+        if len(collex_date_element.findall(self.label_tag)) != 1:
             return "Either zero or too many rdfs:label tags in the collex:date element -- must be exactly one"
 
-        if len(collex_date_element.xpath("rdf:value", namespaces=self.ns)) != 1:
+        values = collex_date_element.findall(self.value_tag)
+        if len(values) != 1:
             return "Either zero or too many rdf:value tags in the collex:date element -- must be exactly one"
 
-        value = collex_date_element.xpath("rdf:value", namespaces=self.ns)[0]
+        value = values[0]
         if not self.is_valid_collex_date_value(value.text):
             return "The rdf:value portion of the collex:date tag is not formatted correctly"
 
@@ -321,6 +584,17 @@ class CollexValidator:
         return True
 
 
+def rng(tag, *children, **attrib):
+    # RELAX NG element; a string child becomes its text
+    element = etree.Element("{http://relaxng.org/ns/structure/1.0}" + tag, attrib)
+    for child in children:
+        if isinstance(child, etree._Element):
+            element.append(child)
+        else:
+            element.text = child
+    return element
+
+
 def is_integer(date):
     try:
         int(date)
@@ -331,4 +605,140 @@ def is_integer(date):
         return False
 
 
-
+def match_contentdm(url):
+    # (scheme, host, collection, item id) of a CONTENTdm item link, or None
+    for regex in CONTENTDM_REGEXES:
+        match = regex.match(url)
+        if match:
+            return match.groups()
+    return None
+
+
+def iter_rdf_items(source):
+    # Yields the items of the first rdf:RDF element as they are parsed,
+    # clearing each one (and anything before it) so memory stays bounded.
+    depth = 0
+    rdf_depth = None
+
+    for event, element in etree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if rdf_depth is None and element.tag == RDF_TAG:
+                rdf_depth = depth
+            continue
+
+        depth -= 1
+        if rdf_depth is None:
+            continue
+        if depth < rdf_depth:
+            break
+        if depth > rdf_depth:
+            continue
+
+        yield element
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def iter_range_jobs(source, chunk_bytes):
+    # (head, tail, source, start, end) jobs covering every item of the
+    # source. A worker parses head + source[start:end] + tail, where head
+    # is everything up to the first item (so namespaces are declared) and
+    # tail closes rdf:RDF. Ranges are cut in front of an item start tag.
+    # A file-like source is read here and each job carries its own bytes
+    # (start and end are None); a source whose layout isn't recognized is
+    # one job parsed as it is (head is None).
+    if isinstance(source, (str, type(u""))):
+        with open(source, mode="rb") as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file can't be mapped
+                data = b""
+            try:
+                for head, tail, start, end in iter_ranges(data, chunk_bytes):
+                    yield head, tail, source, start, end
+            finally:
+                if not isinstance(data, bytes):
+                    data.close()
+    else:
+        data = source.read()
+        for head, tail, start, end in iter_ranges(data, chunk_bytes):
+            yield head, tail, data[start:end], None, None
+
+
+def iter_ranges(data, chunk_bytes):
+    # (head, tail, start, end) for every range of data
+    names = item_qnames(data)
+    if names is None:
+        yield None, None, 0, len(data)
+        return
+    root_name, item_name = names
+
+    root_start = data.find(b"<" + root_name)
+    start = find_start_tag(data, item_name, root_start)
+    end = data.rfind(b"</" + root_name)
+    if root_start < 0 or start < 0 or end < start:
+        yield None, None, 0, len(data)
+        return
+
+    head = bytes(data[:start])
+    tail = b"</" + root_name + b">"
+    while start < end:
+        next_start = find_start_tag(data, item_name, start + chunk_bytes)
+        if next_start < 0 or next_start > end:
+            next_start = end
+        yield head, tail, start, next_start
+        start = next_start
+
+
+def item_qnames(data):
+    # Qualified names of the rdf:RDF element and of its first item as
+    # bytes, e.g. (b"rdf:RDF", b"nb-chicago:nb-chicago"), or None
+    root = None
+    try:
+        for event, element in etree.iterparse(BytesIO(data[:PROBE_BYTES]), events=("start",), recover=True):
+            if root is None:
+                if element.tag == RDF_TAG:
+                    root = element
+            elif element.getparent() is root:
+                return qualified_name(root), qualified_name(element)
+    except etree.XMLSyntaxError:
+        pass
+    return None
+
+
+def qualified_name(element):
+    local_name = etree.QName(element).localname
+    if element.prefix:
+        local_name = element.prefix + ":" + local_name
+    return local_name.encode("utf-8")
+
+
+def find_start_tag(data, name, position):
+    # offset of the next <name ...> or <name> at or after position, or -1
+    pattern = b"<" + name
+    while True:
+        position = data.find(pattern, max(position, 0))
+        if position < 0:
+            return -1
+        following = data[position + len(pattern):position + len(pattern) + 1]
+        if following in (b" ", b"\t", b"\r", b"\n", b">", b"/"):
+            return position
+        position += len(pattern)
+
+
+def validate_range(job):
+    index, local_ns, local_ns_address, (head, tail, source, start, end) = job
+    validator = CollexValidator(local_ns, local_ns_address)
+
+    if start is not None:
+        with open(source, mode="rb") as f:
+            f.seek(start)
+            source = f.read(end - start)
+    if head is not None:
+        source = head + source + tail
+
+    return index, validator.validate_rdf_file(BytesIO(source))
@@ -0,0 +1,31 @@
+import unittest
+
+from gla_benchmark import find_regressions, generate_rows, run_in_worker
+from gla_profile import peak_rss_mb
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic_rows_have_unique_links_and_sample_columns(self):
+        rows = list(generate_rows(50))
+
+        self.assertEqual(50, len(set(row["about_link"] for row in rows)))
+        self.assertIn("subject 1", rows[0])
+        self.assertEqual(rows, list(generate_rows(50)))
+
+    def test_regressions_past_the_threshold_are_reported(self):
+        baseline = [{"stage": "flatten", "records": 1000, "records_per_sec": 100.0},
+                    {"stage": "validate_rdf", "records": 1000, "records_per_sec": 100.0}]
+        results = [{"stage": "flatten", "records": 1000, "records_per_sec": 85.0},
+                   {"stage": "validate_rdf", "records": 1000, "records_per_sec": 75.0},
+                   {"stage": "validate_rdf", "records": 5000, "records_per_sec": 1.0}]
+
+        self.assertEqual(["validate_rdf at 1000 records: 75 records/sec, baseline 100"],
+                         find_regressions(results, baseline, threshold=0.2))
+
+    def test_worker_peak_rss_does_not_include_the_parent(self):
+        ballast = bytearray(200 * 1024 * 1024)
+        for i in range(0, len(ballast), 4096):
+            ballast[i] = 1
+
+        self.assertGreater(peak_rss_mb(), 200)
+        self.assertLess(run_in_worker(peak_rss_mb), 200)
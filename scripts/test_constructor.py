@@ -0,0 +1,170 @@
+from io import BytesIO
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from gla_utils import CollexValidator, TagBuilder
+from gla_rdf_constructor import DEFAULT_COLUMNS, DictRowMapper, RowMapper, ShardWriter, build_incremental, main, \
+    make_item_fields, make_item_rdf, serialize_rdf, write_rdf_stream
+
+
+class TestConstructor(unittest.TestCase):
+    def setUp(self):
+        self.tb = TagBuilder("test", "http://test.org/#")
+        self.rows = [{"about_link": "http://test.org/1",
+                      "thumb_link": "http://test.org/1/thumb",
+                      "year_begin": "1930",
+                      "year_end": "1939",
+                      "title": u"Caf\u00e9 on State Street",
+                      "format": "Photograph",
+                      "subject 1": "Chicago (Ill.)",
+                      "creator 1": "Sloan, Percy H."},
+                     {"about_link": "http://test.org/2",
+                      "title": "Map of the lakes",
+                      "format": "map",
+                      "identifier": "Ayer  MS\n 123"}]
+
+    def make_items(self):
+        return [make_item_rdf(dict(row), self.tb, ns_name="test") for row in self.rows]
+
+    def test_stream_output_matches_tree_output(self):
+        tree = self.tb.root()
+        for item in self.make_items():
+            tree.append(item)
+
+        f = BytesIO()
+        write_rdf_stream(iter(self.make_items()), self.tb, f)
+
+        self.assertEqual(serialize_rdf(tree), f.getvalue())
+
+    def test_stream_output_with_no_items_matches_tree_output(self):
+        f = BytesIO()
+        write_rdf_stream(iter([]), self.tb, f)
+
+        self.assertEqual(serialize_rdf(self.tb.root()), f.getvalue())
+
+    def test_empty_csv_gives_empty_document(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        input_filename = os.path.join(directory, "empty.csv")
+        open(input_filename, mode="w").close()
+
+        for options in ({}, {"stream": True}, {"incremental": True}):
+            output_filename = os.path.join(directory, "empty.rdf")
+            main("test", "http://test.org/#", input_filename, output_filename, **options)
+            with open(output_filename, mode="rb") as f:
+                self.assertEqual(serialize_rdf(self.tb.root()), f.read())
+
+    def test_incremental_build_rejects_stream_and_shards(self):
+        for options in ({"stream": True}, {"shards": {"max_items": 1}}):
+            self.assertRaises(ValueError, main, "test", "http://test.org/#", "test.csv", "test.rdf",
+                              incremental=True, **options)
+
+    def test_incremental_build_only_rebuilds_changed_rows(self):
+        validator = CollexValidator("test", "http://test.org/#")
+        rows = self.rows + [{"about_link": "http://test.org/3", "title": "Dropped", "format": "text"}]
+        errors, manifest = build_incremental(iter(rows), self.tb, validator, BytesIO(), {})
+
+        self.rows[1]["title"] = "Map of the Great Lakes"
+        f = BytesIO()
+        errors, new_manifest = build_incremental(iter(self.rows), self.tb, validator, f, manifest)
+
+        expected = BytesIO()
+        write_rdf_stream(iter(self.make_items()), self.tb, expected)
+        self.assertEqual(expected.getvalue(), f.getvalue())
+        self.assertEqual(sorted(["http://test.org/1", "http://test.org/2"]), sorted(new_manifest["items"]))
+        self.assertIs(manifest["items"]["http://test.org/1"], new_manifest["items"]["http://test.org/1"])
+        self.assertIsNot(manifest["items"]["http://test.org/2"], new_manifest["items"]["http://test.org/2"])
+
+    def test_incremental_build_rebuilds_everything_when_columns_change(self):
+        validator = CollexValidator("test", "http://test.org/#")
+        rows = [dict(row, publisher="Rand McNally") for row in self.rows]
+        errors, manifest = build_incremental(iter(rows), self.tb, validator, BytesIO(), {})
+
+        columns = DEFAULT_COLUMNS + (("publisher", "role:PBL"),)
+        f = BytesIO()
+        errors, new_manifest = build_incremental(iter(rows), self.tb, validator, f, manifest,
+                                                 mapper=DictRowMapper("test", columns))
+
+        self.assertNotEqual(manifest["columns"], new_manifest["columns"])
+        self.assertEqual(len(rows), f.getvalue().count(b"<role:PBL>Rand McNally</role:PBL>"))
+
+    def write_shards(self, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        writer = ShardWriter(self.tb, os.path.join(directory, "test.rdf"), **options)
+        write_rdf_stream(iter(self.make_items() * 3), self.tb, None, writer=writer)
+
+        with open(os.path.join(directory, "test.rdf.index.json")) as f:
+            index = json.load(f)
+        documents = []
+        for shard in index["shards"]:
+            with open(os.path.join(directory, shard["file"]), mode="rb") as f:
+                data = f.read()
+            self.assertEqual(hashlib.sha256(data).hexdigest(), shard["sha256"])
+            documents.append(gzip.GzipFile(fileobj=BytesIO(data)).read() if options.get("compress") else data)
+        return index, documents
+
+    def test_shards_split_items_by_count(self):
+        index, documents = self.write_shards(max_items=4)
+
+        self.assertEqual([4, 2], [shard["records"] for shard in index["shards"]])
+        self.assertEqual(["test.00001.rdf", "test.00002.rdf"], [shard["file"] for shard in index["shards"]])
+        tree = self.tb.root()
+        for item in self.make_items() * 2:
+            tree.append(item)
+        self.assertEqual(serialize_rdf(tree), documents[1])
+
+    def test_compressed_shards_stay_under_max_bytes(self):
+        index, documents = self.write_shards(max_bytes=2000, compress=True, pretty_print=False)
+
+        self.assertEqual(6, index["records"])
+        self.assertTrue(len(documents) > 1)
+        for shard, document in zip(index["shards"], documents):
+            self.assertTrue(shard["file"].endswith(".rdf.gz"))
+            self.assertTrue(len(document) <= 2000)
+            self.assertEqual(shard["records"], len(etree.fromstring(document)))
+
+    def test_row_mapper_matches_dict_rows(self):
+        fieldnames = ["about_link", "title", "format", "subject 1", "creator 1", "identifier", "thumb_link",
+                      "year_begin", "year_end"]
+        mapper = RowMapper(fieldnames, "test")
+        for dct in self.rows:
+            row = [dct.get(name, "") for name in fieldnames]
+            self.assertEqual(make_item_fields(dict((name, dct.get(name, "")) for name in fieldnames), "test"),
+                             mapper.fields(row))
+
+    def test_row_mapper_uses_custom_columns(self):
+        mapper = RowMapper(["about_link", "title", "format", "Subject", "Artist", "Lang"], "test",
+                           columns=[["Subject", "subject"], ["Artist", "role:ART"], ["Lang", "language"]])
+        fields = mapper.fields(["http://test.org/1", "Lake", "photograph", "Ships", "Doe, Jane", "eng"])
+
+        self.assertEqual([("subject", "Ships"), ("role", ("Doe, Jane", "ART")), ("language", "eng")], fields[-3:])
+        self.assertRaises(ValueError, RowMapper, ["about_link"], "test", [["x", "not_a_field"]])
+
+    def test_build_item_matches_per_field_methods(self):
+        fields = [("seeAlso", "http://test.org/1"), ("thumbnail", ""), ("archive", "test"),
+                  ("collex_date", ("c. 1930-1939", "1930,1939")), ("dc_date", "Uncertain"),
+                  ("role", ("Sloan, Percy H.", "cre")), ("title", ""), ("alternative_title", "Alt")]
+        expected = self.tb.item(weblink="http://test.org/1")
+        expected.append(self.tb.seeAlso(weblink="http://test.org/1"))
+        expected.append(self.tb.thumbnail(weblink=""))
+        expected.append(self.tb.archive("test"))
+        expected.append(self.tb.collex_date(label="c. 1930-1939", value="1930,1939"))
+        expected.append(self.tb.dc_date("Uncertain"))
+        expected.append(self.tb.role("Sloan, Percy H.", "cre"))
+        expected.append(self.tb.title(""))
+        expected.append(self.tb.alternative_title("Alt"))
+
+        expected_tree = self.tb.root()
+        expected_tree.append(expected)
+        tree = self.tb.root()
+        tree.append(self.tb.build_item("http://test.org/1", fields))
+
+        self.assertEqual(serialize_rdf(expected_tree), serialize_rdf(tree))
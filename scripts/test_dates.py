@@ -0,0 +1,48 @@
+import unittest
+
+from gla_dates import DateNormalizer, date_range, parse_date
+from gla_utils import CollexValidator
+
+
+class TestDates(unittest.TestCase):
+    def test_free_text_dates_are_parsed(self):
+        self.assertEqual(("1930s?", "193u"), parse_date("1930s?"))
+        self.assertEqual(("1944-1968", "1944,1968"), parse_date("1944-1968"))
+        self.assertEqual(("c. 1880", "1880"), parse_date("c. 1880"))
+        self.assertEqual(("c. 1720", "1720"), parse_date("[ca. 1720]\n\n2003"))
+        self.assertEqual(("between 1827 and 1832", "1827,1832"), parse_date("[between 1827 and 1832]\n\nNovember 2004"))
+        self.assertEqual(("1948-05-10", "1948"), parse_date("1948-05-10\n"))
+        self.assertEqual(("1800s", "18uu"), parse_date("1800s"))
+        self.assertEqual(("1985", "1985"), parse_date("1985."))
+
+    def test_year_month_and_short_ranges_are_told_apart(self):
+        self.assertEqual(("1948-05", "1948"), parse_date("1948-05"))
+        self.assertEqual(("1910-12", "1910"), parse_date("1910-12"))
+        self.assertEqual(("1861-65", "1861,1865"), parse_date("1861-65"))
+        self.assertEqual(("1944-68", "1944,1968"), parse_date("1944-68"))
+        self.assertEqual(("c. 1895-20", "1895,1920"), parse_date("ca. 1895-20"))
+
+    def test_undated_text_gives_none(self):
+        self.assertIsNone(parse_date("\n4/29/2008"))
+        self.assertIsNone(parse_date("Uncertain"))
+        self.assertIsNone(parse_date("[Ann Arbor, Mich. :"))
+        self.assertIsNone(parse_date(""))
+
+    def test_values_are_valid_collex_dates(self):
+        for text in ["1930s?", "1944-1968", "1800s", "1898, c.1893", "1930s-1940s", "1850; 1863"]:
+            self.assertTrue(CollexValidator.is_valid_collex_date_value(parse_date(text)[1]))
+
+    def test_date_range(self):
+        self.assertEqual((1930, 1930), date_range("1930"))
+        self.assertEqual((1930, 1939), date_range("193u"))
+        self.assertEqual((1800, 1899), date_range("18uu"))
+        self.assertEqual((1944, 1968), date_range("1944,1968"))
+        self.assertIsNone(date_range("Uncertain"))
+
+    def test_normalizer_parses_each_string_once(self):
+        dates = DateNormalizer(maxsize=2)
+        texts = ["1930s?", "1944-1968", "1930s?", "1930s?", "c. 1880", "1944-1968"]
+
+        self.assertEqual([parse_date(text) for text in texts], dates.normalize_all(texts))
+        self.assertEqual(3, dates.misses)
+        self.assertEqual(2, len(dates.cache))
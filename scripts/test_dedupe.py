@@ -0,0 +1,33 @@
+import unittest
+
+from gla_dedupe import DuplicateIndex, normalize_about
+
+
+def record(archive, about, title, date="", identifiers=()):
+    return {"archive": archive, "about": about, "title": title, "date": date, "identifiers": list(identifiers)}
+
+
+class TestDedupe(unittest.TestCase):
+    def test_contentdm_links_normalize_to_the_same_key(self):
+        self.assertEqual(normalize_about("http://collections.carli.illinois.edu:80/cdm/ref/collection/nby_grlakes/id/9"),
+                         normalize_about("http://collections.carli.illinois.edu/u?/nby_grlakes,9"))
+
+    def test_exact_and_near_duplicates_are_grouped(self):
+        index = DuplicateIndex()
+        index.add(record("newgl", "http://collections.carli.illinois.edu/u?/nby_grlakes,9", "Map of Michigan", "1836"))
+        index.add(record("nb-chicago", "http://collections.carli.illinois.edu:80/cdm/ref/collection/nby_grlakes/id/9",
+                         "Something else entirely", "1836"))
+        index.add(record("nb-ayer", "http://a.org/1", "Nahcunabowbow (Standing Forward), Chippewa", "Uncertain",
+                         identifiers=["Ayer Photographs box 25  AP 299"]))
+        index.add(record("nb-chicago", "http://a.org/2", "Unrelated title", identifiers=["ayer photographs box 25 AP 299"]))
+        index.add(record("hmo", "http://b.org/1", "Improved map of the territories of Michigan and Ouisconsin", "1836"))
+        index.add(record("newgl", "http://b.org/2", "Improved map of the territories of Michigan & Ouisconsin.", "1836"))
+        index.add(record("nb-ayer", "http://b.org/3", "Improved map of the territories of Michigan and Ouisconsin", "1840"))
+
+        groups = [(reasons, [about for archive, about, title, date in records])
+                  for reasons, records in index.groups()]
+
+        self.assertEqual([(["about"], ["http://collections.carli.illinois.edu/u?/nby_grlakes,9",
+                                       "http://collections.carli.illinois.edu:80/cdm/ref/collection/nby_grlakes/id/9"]),
+                          (["identifier"], ["http://a.org/1", "http://a.org/2"]),
+                          (["title+date"], ["http://b.org/1", "http://b.org/2"])], groups)
@@ -0,0 +1,62 @@
+from io import BytesIO, StringIO
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from gla_diff import canonical_item, diff_files, sorted_item_hashes, write_delta
+
+HEAD = """<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:dc="http://purl.org/dc/elements/1.1/"
+         xmlns:test="http://test.org/#">
+"""
+ITEM = """<test:test rdf:about="http://test.org/{0}"><dc:title>{1}</dc:title><dc:subject>Streets</dc:subject></test:test>
+"""
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, items):
+        filename = os.path.join(self.directory, name)
+        with open(filename, mode="w") as f:
+            f.write(HEAD + "".join(items) + "</rdf:RDF>\n")
+        return filename
+
+    def test_canonical_form_ignores_order_and_whitespace(self):
+        a = etree.fromstring('<item><b x="1" y="2">Lake   Street</b><a/></item>')
+        b = etree.fromstring('<item>\n  <a/>\n  <b y="2" x="1">Lake\nStreet</b>\n</item>')
+        c = etree.fromstring('<item><b x="1" y="2">Lake Street</b><a>1</a></item>')
+        self.assertEqual(canonical_item(a), canonical_item(b))
+        self.assertNotEqual(canonical_item(a), canonical_item(c))
+
+    def test_sorted_runs_are_merged(self):
+        filename = self.write("new.rdf", [ITEM.format(i, "Item") for i in (5, 3, 9, 1, 7, 3)])
+        abouts = [about for about, digest in sorted_item_hashes(filename, run_size=2)]
+        self.assertEqual(["http://test.org/{0}".format(i) for i in (1, 3, 5, 7, 9)], abouts)
+
+    def test_change_set_and_delta(self):
+        old = self.write("old.rdf", [ITEM.format(i, "Item {0}".format(i)) for i in range(1, 6)])
+        new = self.write("new.rdf", [ITEM.format(i, "Item {0}".format(i)) for i in (2, 3, 6)] +
+                         ['<test:test rdf:about="http://test.org/5">\n  <dc:subject>Streets</dc:subject>\n'
+                          '  <dc:title>Item 5</dc:title>\n</test:test>\n',
+                          ITEM.format(4, "Item four")])
+
+        changes = StringIO()
+        counts, delta = diff_files(old, new, changes, run_size=2)
+
+        self.assertEqual({"added": 1, "removed": 1, "changed": 1, "unchanged": 3}, counts)
+        self.assertEqual(["change,about", "removed,http://test.org/1", "changed,http://test.org/4",
+                          "added,http://test.org/6"], changes.getvalue().splitlines())
+
+        f = BytesIO()
+        self.assertEqual(2, write_delta(new, delta, f))
+        items = etree.fromstring(f.getvalue())
+        self.assertEqual(["http://test.org/6", "http://test.org/4"],
+                         [item.get("{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about") for item in items])
@@ -0,0 +1,22 @@
+from io import StringIO
+import unittest
+
+from flatten_csv import flatten_file
+
+EXPORT = """identifier,title,subject
+ship-1,Northwest,Rigging
+,,People
+ship-2,Alpena,
+,,Steamboats
+,,Harbors
+"""
+
+
+class TestFlattenCsv(unittest.TestCase):
+    def test_compound_records_become_one_row(self):
+        f_out = StringIO()
+        flatten_file(StringIO(EXPORT), f_out)
+
+        self.assertEqual("identifier 1,title 1,subject 1,subject 2\r\n"
+                         "ship-1,Northwest,Rigging,People\r\n"
+                         "ship-2,Alpena,Steamboats,Harbors\r\n", f_out.getvalue())
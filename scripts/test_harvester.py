@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from lxml import etree
+
+from gla_harvester import Harvester, HarvestError
+
+PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <ListRecords>
+    {records}
+    <resumptionToken>{token}</resumptionToken>
+  </ListRecords>
+</OAI-PMH>"""
+
+RECORD = """<record><metadata>
+      <oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/"
+                 xmlns:dc="http://purl.org/dc/elements/1.1/">
+        <dc:title>Ship {0}</dc:title>
+        <dc:identifier>http://name.umdl.umich.edu/ship-{0}</dc:identifier>
+      </oai_dc:dc>
+    </metadata></record>"""
+
+
+class StandInOaiServer:
+    # Three pages of two records each, chained by resumptionToken. Tokens in
+    # `failures` answer with HTTP 500 that many times before succeeding.
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.requests = []
+
+    async def handle(self, request):
+        token = request.query.get("resumptionToken", "")
+        self.requests.append(token)
+        if self.failures.get(token):
+            self.failures[token] -= 1
+            return web.Response(status=500)
+
+        page = {"": 0, "page-1": 1, "page-2": 2}[token]
+        records = "".join(RECORD.format(page * 2 + i) for i in range(2))
+        next_token = "page-{0}".format(page + 1) if page < 2 else ""
+        return web.Response(body=PAGE.format(records=records, token=next_token).encode("utf-8"),
+                            content_type="text/xml")
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/oai", self.handle)
+        return app
+
+
+class TestHarvester(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, "checkpoint.json")
+        self.output = os.path.join(self.directory, "ships.rdf")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    async def harvest(self, server, retries):
+        async with TestServer(server.app()) as test_server:
+            archive = {"ns_name": "test",
+                       "ns_address": "http://test.org/#",
+                       "output": self.output,
+                       "oai": {"url": str(test_server.make_url("/oai"))}}
+            harvester = Harvester(self.checkpoint, retries=retries, backoff=0)
+            return await harvester.harvest([archive])
+
+    def harvested_titles(self):
+        return [title.text for title in etree.parse(self.output).iter("{http://purl.org/dc/elements/1.1/}title")]
+
+    async def test_pages_are_followed_and_failures_retried(self):
+        server = StandInOaiServer(failures={"page-1": 2})
+
+        results = await self.harvest(server, retries=2)
+
+        self.assertEqual(6, results[0]["records"])
+        self.assertEqual(["Ship {0}".format(i) for i in range(6)], self.harvested_titles())
+        self.assertEqual(["", "page-1", "page-1", "page-1", "page-2"], server.requests)
+        self.assertFalse(os.path.exists(self.output + ".parts"))
+
+    async def test_interrupted_harvest_resumes_from_last_token(self):
+        with self.assertRaises(HarvestError):
+            await self.harvest(StandInOaiServer(failures={"page-2": 1}), retries=0)
+
+        server = StandInOaiServer()
+        results = await self.harvest(server, retries=0)
+
+        self.assertEqual(["page-2"], server.requests)
+        self.assertEqual(6, results[0]["records"])
+        self.assertEqual(["Ship {0}".format(i) for i in range(6)], self.harvested_titles())
+
+    async def test_interrupted_assembly_does_not_harvest_again(self):
+        with mock.patch("gla_harvester.finish_output", side_effect=OSError("No space left on device")):
+            with self.assertRaises(OSError):
+                await self.harvest(StandInOaiServer(), retries=0)
+
+        server = StandInOaiServer()
+        results = await self.harvest(server, retries=0)
+
+        self.assertEqual([], server.requests)
+        self.assertEqual(6, results[0]["records"])
+        self.assertEqual(["Ship {0}".format(i) for i in range(6)], self.harvested_titles())
+
+    async def test_checkpoint_without_parts_file_harvests_again(self):
+        with mock.patch("gla_harvester.finish_output", side_effect=OSError("No space left on device")):
+            with self.assertRaises(OSError):
+                await self.harvest(StandInOaiServer(), retries=0)
+        os.remove(self.output + ".parts")
+
+        server = StandInOaiServer()
+        results = await self.harvest(server, retries=0)
+
+        self.assertNotEqual([], server.requests)
+        self.assertEqual(6, results[0]["records"])
+        self.assertEqual(["Ship {0}".format(i) for i in range(6)], self.harvested_titles())
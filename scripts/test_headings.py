@@ -0,0 +1,54 @@
+import unittest
+
+from gla_headings import HeadingNormalizer, parse_headings
+from gla_rdf_constructor import make_item_fields
+
+
+class TestHeadings(unittest.TestCase):
+    def test_subjects_are_split_and_canonicalized(self):
+        self.assertEqual(("Illinois", "Chicago"), parse_headings("Illinois--Chicago\n", subdivisions=True))
+        self.assertEqual(("Indians of North America", "Ojibwa Indians"),
+                         parse_headings("indians of North America; Ojibwa Indians.", subdivisions=True))
+        self.assertEqual(("United States, West",), parse_headings(" United States ,\nWest ", subdivisions=True))
+        self.assertEqual(("Implements, utensils, etc.",), parse_headings("Implements, utensils, etc."))
+        self.assertEqual(("Chicago (Ill.)",), parse_headings("Chicago (Ill.)"))
+        self.assertEqual(("Streets",), parse_headings("Streets; streets", subdivisions=True))
+
+    def test_authorized_forms_are_kept(self):
+        self.assertEqual(("United States", "History", "Civil War, 1861-1865 : Lincoln"),
+                         parse_headings("United States--History--Civil War, 1861-1865 : Lincoln", subdivisions=True))
+        self.assertEqual(("Bounty (Ship : Launched 1789)",), parse_headings("Bounty (Ship : Launched 1789)"))
+        self.assertEqual(("Sloan, Percy H., Mrs.",), parse_headings("Sloan, Percy H., Mrs."))
+        self.assertEqual(("Smith, John, Rev.", "Brown, Dr."), parse_headings("Smith, John, Rev.; Brown, Dr."))
+
+    def test_names_are_only_split_on_semicolons(self):
+        self.assertEqual(("Arrowsmith, Aaron, 1750-1823", "Sloan, Percy H."),
+                         parse_headings("Arrowsmith, Aaron, 1750-1823.; Sloan, Percy H."))
+        self.assertEqual(("Sloan, Percy H. (Percy Haydn), 1867-",),
+                         parse_headings("Sloan, Percy H. (Percy Haydn), 1867-"))
+
+    def test_normalizer_interns_canonical_strings(self):
+        headings = HeadingNormalizer(maxsize=2)
+        first = headings.normalize("Illinois--Chicago", subdivisions=True)
+        second = headings.normalize("illinois -- Chicago\n", subdivisions=True)
+        third = headings.normalize("Illinois--Chicago", subdivisions=True)
+
+        self.assertEqual(first, second)
+        self.assertIs(first[0], second[0])
+        self.assertIs(first, third)
+        self.assertEqual((1, 2), (headings.hits, headings.misses))
+
+        headings.normalize("Streets")
+        headings.normalize("Lakes")
+        self.assertEqual(2, len(headings.cache))
+
+    def test_item_fields_use_normalized_headings(self):
+        fields = make_item_fields({"about_link": "http://test.org/1",
+                                   "title": "Lake Street",
+                                   "format": "Photograph",
+                                   "subject 1": "Illinois--Chicago\n",
+                                   "creator 1": "Sloan, Percy H.; Doe, Jane."}, "test")
+        self.assertEqual([("subject", "Illinois"), ("subject", "Chicago")],
+                         [field for field in fields if field[0] == "subject"])
+        self.assertEqual([("role", ("Sloan, Percy H.", "CRE")), ("role", ("Doe, Jane", "CRE"))],
+                         [field for field in fields if field[0] == "role"])
@@ -0,0 +1,78 @@
+from io import BytesIO
+import unittest
+
+from gla_ingest import iter_record_elements, iter_records
+
+OAI_DUMP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <ListRecords>
+    <record>
+      <header><identifier>oai:quod.lib.umich.edu:101662</identifier></header>
+      <metadata>
+        <oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/"
+                   xmlns:dc="http://purl.org/dc/elements/1.1/">
+          <dc:title>NORTHWEST; 101662.101691</dc:title>
+          <dc:subject>Rigging; People</dc:subject>
+          <dc:contributor>Rand McNally Collection.</dc:contributor>
+          <dc:date>1882</dc:date>
+          <dc:identifier>101662.101691</dc:identifier>
+          <dc:identifier>http://name.umdl.umich.edu/IC-TBNMS1IC-X-101662</dc:identifier>
+          <dc:type>image</dc:type>
+        </oai_dc:dc>
+      </metadata>
+    </record>
+  </ListRecords>
+</OAI-PMH>"""
+
+RDF_DUMP = b"""<?xml version="1.0"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <rdf:Description about="http://collections.carli.illinois.edu:80/cdm/ref/collection/nby_eeayer/id/45">
+    <dc:title>Nahcunabowbow (Standing Forward), Chippewa
+</dc:title>
+    <dc:creator></dc:creator>
+    <dc:subject>Indians of North America; Ojibwa Indians
+</dc:subject>
+    <dc:date>
+4/29/2008</dc:date>
+  </rdf:Description>
+</rdf:RDF>"""
+
+
+class TestIngest(unittest.TestCase):
+    def test_oai_dc_records_are_mapped_to_rows(self):
+        rows = list(iter_records(BytesIO(OAI_DUMP)))
+
+        self.assertEqual([{"about_link": "http://name.umdl.umich.edu/IC-TBNMS1IC-X-101662",
+                           "thumb_link": "",
+                           "title": "NORTHWEST; 101662.101691",
+                           "type": "image",
+                           "identifier 1": "101662.101691",
+                           "identifier 2": "http://name.umdl.umich.edu/IC-TBNMS1IC-X-101662",
+                           "subject 1": "Rigging",
+                           "subject 2": "People",
+                           "date": "1882"}], rows)
+
+    def test_rdf_descriptions_are_mapped_to_rows(self):
+        rows = list(iter_records(BytesIO(RDF_DUMP)))
+
+        self.assertEqual([{"about_link": "http://collections.carli.illinois.edu:80/cdm/ref/collection/nby_eeayer/id/45",
+                           "thumb_link": "http://collections.carli.illinois.edu/utils/getthumbnail/collection/nby_eeayer/id/45",
+                           "title": "Nahcunabowbow (Standing Forward), Chippewa",
+                           "subject 1": "Indians of North America",
+                           "subject 2": "Ojibwa Indians",
+                           "date": "4/29/2008"}], rows)
+
+    def test_converted_records_are_removed(self):
+        dump = RDF_DUMP.replace(b"</rdf:RDF>", b"""  <rdf:Description about="http://a.org/2"><dc:title>Two</dc:title></rdf:Description>
+  <rdf:Description about="http://a.org/3"><dc:title>Three</dc:title></rdf:Description>
+</rdf:RDF>""")
+        earlier_records = []
+        for element in iter_record_elements(BytesIO(dump)):
+            root = element.getroottree().getroot()
+            earlier_records.append([len(record) for record in element.itersiblings(preceding=True)])
+
+        # only the record converted just before, already cleared
+        self.assertEqual([[], [0], [0]], earlier_records)
+        self.assertEqual(1, len(root))
+        self.assertEqual(0, len(root[0]))
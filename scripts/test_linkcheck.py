@@ -0,0 +1,89 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from gla_utils import TagBuilder
+from gla_rdf_constructor import write_rdf_stream
+from gla_linkcheck import LinkCache, LinkChecker, check_files
+
+
+class TestLinkCheck(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    async def handle(self, request):
+        self.requests.append((request.method, request.path))
+        if request.path == "/missing":
+            return web.Response(status=404)
+        if request.path == "/no-head" and request.method == "HEAD":
+            return web.Response(status=405)
+        return web.Response(text="ok")
+
+    def write_rdf(self, base_url):
+        tb = TagBuilder("test", "http://test.org/#")
+        items = []
+        for name, thumb in (("item", "/ok"), ("gone", "/missing"), ("old", "/no-head")):
+            item = tb.item(weblink=base_url + "/" + name)
+            item.append(tb.seeAlso(weblink=base_url + "/ok"))
+            item.append(tb.thumbnail(weblink=base_url + thumb))
+            items.append(item)
+
+        filename = os.path.join(self.directory, "test.rdf")
+        with open(filename, mode="wb") as f:
+            write_rdf_stream(iter(items), tb, f)
+        return filename
+
+    async def check(self, filename):
+        cache = LinkCache(os.path.join(self.directory, "cache.sqlite"))
+        report = io.StringIO()
+        try:
+            counts = await check_files([filename], LinkChecker(cache, per_host_rate=0), csv.writer(report))
+        finally:
+            cache.close()
+        return counts, list(csv.reader(io.StringIO(report.getvalue())))
+
+    async def test_broken_links_are_reported_per_item_and_cached(self):
+        app = web.Application()
+        app.router.add_route("*", "/{path}", self.handle)
+        async with TestServer(app) as server:
+            base_url = str(server.make_url("")).rstrip("/")
+            filename = self.write_rdf(base_url)
+
+            (total, broken), rows = await self.check(filename)
+            self.assertEqual((6, 1), (total, broken))
+            self.assertEqual([[base_url + "/gone", "collex:thumbnail", base_url + "/missing", "404", ""]], rows)
+            self.assertEqual(sorted([("HEAD", "/ok"), ("HEAD", "/missing"), ("HEAD", "/no-head"), ("GET", "/no-head")]),
+                             sorted(self.requests))
+
+            self.requests = []
+            (total, broken), rows = await self.check(filename)
+            self.assertEqual((6, 1), (total, broken))
+            self.assertEqual([], self.requests)
+
+    async def test_rate_limited_host_does_not_block_other_hosts(self):
+        app = web.Application()
+        app.router.add_route("*", "/{path}", self.handle)
+        async with TestServer(app, host="127.0.0.1") as server:
+            slow_host = "http://127.0.0.1:{0}".format(server.port)
+            other_host = "http://localhost:{0}".format(server.port)
+            links = [("a", "rdfs:seeAlso", slow_host + "/ok{0}".format(i)) for i in range(3)]
+            links.append(("b", "rdfs:seeAlso", other_host + "/ok"))
+
+            cache = LinkCache(":memory:")
+            checker = LinkChecker(cache, concurrency=2, per_host_rate=4.0)
+            try:
+                order = [about async for about, field, url, result in checker.check_links(iter(links))]
+            finally:
+                cache.close()
+
+        self.assertEqual(["a", "b", "a", "a"], order)
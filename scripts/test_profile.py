@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from gla_rdf_constructor import main as build_rdf
+from gla_profile import RULE_METHODS, Timings
+
+CSV = """about_link,title,format,subject 1,creator 1,year_begin
+http://test.org/1,Lake Street,Photograph,Streets,"Sloan, Percy H.",1930
+http://test.org/2,Map of the lakes,map,,,
+"""
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input = os.path.join(self.directory, "test.csv")
+        with open(self.input, mode="w") as f:
+            f.write(CSV)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, output, **kwargs):
+        output = os.path.join(self.directory, output)
+        build_rdf("test", "http://test.org/#", self.input, output, **kwargs)
+        with open(output, mode="rb") as f:
+            return f.read()
+
+    def test_report_covers_stages_and_rules(self):
+        for stream in (False, True):
+            self.build("test.rdf", stream=stream, profile=True)
+            with open(os.path.join(self.directory, "test.rdf.profile.json")) as f:
+                report = json.load(f)
+
+            self.assertEqual(2, report["records"])
+            self.assertEqual(["make_item_rdf", "read", "serialize", "validate"], sorted(report["stages"]))
+            self.assertEqual(sorted(RULE_METHODS), sorted(report["rules"]))
+            self.assertEqual(2, report["rules"]["check_date_fields"]["calls"])
+            self.assertEqual(2, report["stages"]["read"]["calls"])
+
+    def test_profiling_does_not_change_output(self):
+        self.assertEqual(self.build("plain.rdf", stream=True, profile=False),
+                         self.build("profiled.rdf", stream=True, profile=True))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "plain.rdf.profile.json")))
+
+    def test_percentiles_are_read_off_the_histogram(self):
+        timings = Timings()
+        for i in range(1, 101):
+            timings.add(i / 1000.0)
+
+        self.assertEqual(100, timings.calls)
+        self.assertAlmostEqual(5.05, timings.seconds)
+        self.assertTrue(0.050 <= timings.percentile(50) <= 0.050 * 1.05)
+        self.assertTrue(0.099 <= timings.percentile(99) <= 0.099 * 1.05)
+        self.assertEqual(0.1, timings.percentile(100))
+        self.assertEqual(0.0, Timings().percentile(50))
+
+    def test_histogram_does_not_grow(self):
+        timings = Timings()
+        size = len(timings.buckets)
+        for i in range(10000):
+            timings.add(i * 1e-6)
+        timings.add(1e6)
+
+        self.assertEqual(size, len(timings.buckets))
+        self.assertEqual(1e6, timings.percentile(100))
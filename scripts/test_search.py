@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from gla_search import SearchIndex
+
+HEAD = """<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#"
+         xmlns:dc="http://purl.org/dc/elements/1.1/"
+         xmlns:role="http://www.loc.gov/loc.terms/relators/"
+         xmlns:collex="http://www.collex.org/schema#"
+         xmlns:test="http://test.org/#">
+"""
+ITEM = """<test:test rdf:about="http://test.org/{0}">
+    <dc:title>{1}</dc:title>
+    <dc:subject>{2}</dc:subject>
+    <dc:type>{3}</dc:type>
+    <dc:date><collex:date><rdfs:label>{4}</rdfs:label><rdf:value>{4}</rdf:value></collex:date></dc:date>
+    <role:CRE>Sloan, Percy H.</role:CRE>
+    <collex:archive>test</collex:archive>
+    <collex:genre>Photograph</collex:genre>
+</test:test>
+"""
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = SearchIndex(":memory:")
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.directory)
+
+    def write_items(self, items, name="test.rdf"):
+        filename = os.path.join(self.directory, name)
+        with open(filename, mode="w") as f:
+            f.write(HEAD + "".join(ITEM.format(*item) for item in items) + "</rdf:RDF>\n")
+        return filename
+
+    def index_items(self, items, replace=False):
+        return self.index.index_file(self.write_items(items), replace=replace)
+
+    def abouts(self, *args, **kwargs):
+        return sorted(result["about"] for result in self.index.search(*args, **kwargs))
+
+    def test_search_text_and_facets(self):
+        self.index_items([(1, "Lake Street", "Indians of North America", "Still Image", "1930"),
+                          (2, "Map of the lakes", "Indains of North America", "Map", "184u"),
+                          (3, "State Street", "Streets", "Still Image", "1944,1968")])
+
+        self.assertEqual(["http://test.org/2"], self.abouts('subject:"Indains"'))
+        self.assertEqual(["http://test.org/1", "http://test.org/3"], self.abouts("street"))
+        self.assertEqual(["http://test.org/1", "http://test.org/2", "http://test.org/3"], self.abouts("sloan"))
+        self.assertEqual(["http://test.org/2"], self.abouts(type="Map", archive="test"))
+        self.assertEqual(["http://test.org/1", "http://test.org/3"], self.abouts(year_from=1930, year_to=1950))
+        self.assertRaises(ValueError, self.index.search, "street", discipline="History")
+
+    def test_upserts_are_keyed_on_about(self):
+        items = [(1, "Lake Street", "Streets", "Still Image", "1930"),
+                 (2, "Map of the lakes", "Lakes", "Map", "1840")]
+        self.assertEqual({"inserted": 2, "updated": 0, "unchanged": 0, "deleted": 0}, self.index_items(items))
+        self.assertEqual({"inserted": 0, "updated": 0, "unchanged": 2, "deleted": 0}, self.index_items(items))
+
+        items[1] = (2, "Map of the Great Lakes", "Lakes", "Map", "1840")
+        self.assertEqual({"inserted": 0, "updated": 1, "unchanged": 1, "deleted": 0}, self.index_items(items))
+        self.assertEqual(["http://test.org/2"], self.abouts("great"))
+        self.assertEqual([], self.abouts('"of the lakes"'))
+
+        self.assertEqual({"inserted": 0, "updated": 0, "unchanged": 1, "deleted": 1},
+                         self.index_items(items[:1], replace=True))
+        self.assertEqual(1, len(self.index))
+
+    def test_replace_keeps_items_of_every_shard(self):
+        items = [(n, "Street {0}".format(n), "Streets", "Still Image", "1930") for n in range(1, 7)]
+        self.index_items(items)
+        shards = [self.write_items(items[:2], "test.0.rdf"), self.write_items(items[2:4], "test.1.rdf")]
+
+        self.assertEqual({"inserted": 0, "updated": 0, "unchanged": 4, "deleted": 2},
+                         self.index.index_files(shards, replace=True))
+        self.assertEqual(4, len(self.index))
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from gla_stats import TopK, corpus_report, corpus_stats, date_decades, file_stats
+
+RDF = """<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:dc="http://purl.org/dc/elements/1.1/"
+         xmlns:role="http://www.loc.gov/loc.terms/relators/"
+         xmlns:collex="http://www.collex.org/schema#"
+         xmlns:test="http://test.org/#">
+    <test:test rdf:about="http://test.org/1">
+        <dc:title>Lake Street</dc:title>
+        <dc:type>Still Image</dc:type>
+        <dc:subject>Streets</dc:subject>
+        <dc:subject>Chicago (Ill.)</dc:subject>
+        <role:CRE>Sloan, Percy H.</role:CRE>
+        <collex:archive>{0}</collex:archive>
+        <collex:genre>Photograph</collex:genre>
+        <dc:date><collex:date><rdfs:label xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#">1944-1968</rdfs:label><rdf:value>1944,1968</rdf:value></collex:date></dc:date>
+    </test:test>
+    <test:test rdf:about="http://test.org/2">
+        <dc:title>Map of the lakes</dc:title>
+        <dc:type>Map</dc:type>
+        <dc:subject>Streets</dc:subject>
+        <collex:archive>{0}</collex:archive>
+        <collex:genre>Photograph</collex:genre>
+        <dc:date>Uncertain</dc:date>
+    </test:test>
+</rdf:RDF>
+"""
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filenames = []
+        for archive in ("one", "two"):
+            filename = os.path.join(self.directory, archive + ".rdf")
+            with open(filename, mode="w") as f:
+                f.write(RDF.format(archive))
+            self.filenames.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_archive_report(self):
+        report = file_stats((self.filenames[0], 10))["one"].report()
+
+        self.assertEqual(2, report["items"])
+        self.assertEqual(1.0, report["fill_rates"]["dc:subject"])
+        self.assertEqual(0.5, report["fill_rates"]["role:CRE"])
+        self.assertEqual([["Map", 1], ["Still Image", 1]], report["facets"]["type"])
+        self.assertEqual([["CRE", 1]], report["facets"]["role"])
+        self.assertEqual([("Streets", 2), ("Chicago (Ill.)", 1)], report["top"]["subject"]["values"])
+        self.assertEqual([[1940, 1], [1950, 1], [1960, 1]], report["decades"])
+        self.assertEqual(1, report["undated"])
+
+    def test_files_are_merged(self):
+        report = corpus_report(corpus_stats(self.filenames * 2, processes=2))
+
+        self.assertEqual(["one", "two"], sorted(report["archives"]))
+        self.assertEqual(4, report["archives"]["one"]["items"])
+        self.assertEqual(8, report["total"]["items"])
+        self.assertEqual([["Photograph", 8]], report["total"]["facets"]["genre"])
+
+    def test_date_decades(self):
+        self.assertEqual([1930], list(date_decades("193u")))
+        self.assertEqual(list(range(1800, 1900, 10)), list(date_decades("18uu")))
+        self.assertEqual([1850], list(date_decades("1851")))
+        self.assertEqual([], list(date_decades("Uncertain")))
+
+    def test_top_k_counts_are_bounded(self):
+        sketch = TopK(capacity=3)
+        values = ["a"] * 50 + ["b"] * 30 + [str(i) for i in range(100)] + ["c"] * 20
+        for value in values:
+            sketch.add(value)
+        other = TopK(capacity=3)
+        for value in values:
+            other.add(value)
+        sketch.merge(other)
+
+        self.assertLessEqual(len(sketch.counts), 6)
+        self.assertEqual(["a", "b", "c"], sorted(value for value, n in sketch.top(3)))
+        for value, true_count in (("a", 100), ("b", 60), ("c", 40)):
+            self.assertLessEqual(sketch.counts[value], true_count)
+            self.assertLessEqual(true_count, sketch.counts[value] + sketch.error)
@@ -0,0 +1,99 @@
+from io import BytesIO
+import os
+import shutil
+import tempfile
+import unittest
+
+from gla_utils import CollexValidator, TagBuilder
+from gla_rdf_constructor import main, make_item_fields, write_rdf_stream
+from gla_store import RecordStore, StoreWriter, build_store, store_to_rdf
+from gla_stats import file_stats
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "test.store")
+        rows = [{"about_link": "http://test.org/1",
+                 "year_begin": "1930",
+                 "year_end": "1939",
+                 "title": u"Caf\u00e9 on State Street",
+                 "format": "Photograph",
+                 "subject 1": "Chicago (Ill.)",
+                 "subject 2": "Streets",
+                 "creator 1": "Sloan, Percy H."},
+                {"about_link": "http://test.org/2",
+                 "title": "Map of the lakes",
+                 "format": "map",
+                 "identifier": "Ayer MS 123"},
+                {"about_link": "http://test.org/3",
+                 "title": "Streets",
+                 "format": "Photograph",
+                 "subject 1": "Streets"}]
+        self.records = [(row["about_link"], make_item_fields(row, "test")) for row in rows]
+
+        writer = StoreWriter("test", "http://test.org/#")
+        for about_link, fields in self.records:
+            writer.add(about_link, fields)
+        with open(self.filename, mode="wb") as f:
+            writer.write(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_records_round_trip(self):
+        with RecordStore(self.filename) as store:
+            self.assertEqual("test", store.ns_name)
+            self.assertEqual(self.records, list(store))
+
+    def test_rdf_from_store_matches_constructor(self):
+        tb = TagBuilder("test", "http://test.org/#")
+        expected = BytesIO()
+        write_rdf_stream((tb.build_item(about_link, fields) for about_link, fields in self.records), tb, expected)
+
+        output = os.path.join(self.directory, "test.rdf")
+        with RecordStore(self.filename) as store:
+            store_to_rdf(store, output)
+        with open(output, mode="rb") as f:
+            self.assertEqual(expected.getvalue(), f.read())
+
+    def test_constructor_reads_store(self):
+        tb = TagBuilder("test", "http://test.org/#")
+        expected = BytesIO()
+        write_rdf_stream((tb.build_item(about_link, fields) for about_link, fields in self.records), tb, expected)
+
+        output = os.path.join(self.directory, "test.rdf")
+        main("test", "http://test.org/#", self.filename, output, stream=True)
+        with open(output, mode="rb") as f:
+            self.assertEqual(expected.getvalue(), f.read())
+
+    def test_store_is_validated_without_parsing(self):
+        tb = TagBuilder("test", "http://test.org/#")
+        tree = tb.root()
+        for about_link, fields in self.records:
+            tree.append(tb.build_item(about_link, fields))
+        validator = CollexValidator("test", "http://test.org/#")
+
+        with RecordStore(self.filename) as store:
+            self.assertEqual(validator.validate_rdf(tree), validator.validate_store(store))
+
+    def test_stats_read_store(self):
+        report = file_stats((self.filename, 10))["test"].report()
+
+        self.assertEqual(3, report["items"])
+        self.assertEqual([["Photograph", 2], ["Unspecified", 1]], report["facets"]["genre"])
+
+    def test_empty_csv_gives_empty_store(self):
+        input_filename = os.path.join(self.directory, "empty.csv")
+        open(input_filename, mode="w").close()
+
+        self.assertEqual(0, build_store("test", "http://test.org/#", input_filename, self.filename))
+        with RecordStore(self.filename) as store:
+            self.assertEqual([], list(store))
+
+    def test_repeated_values_are_stored_once(self):
+        with RecordStore(self.filename) as store:
+            self.assertEqual({"Streets": 2, "Chicago (Ill.)": 1}, store.value_counts("subject"))
+            self.assertEqual({"Still Image": 2, "Map": 1}, store.value_counts("type_"))
+            self.assertEqual(1, len(store.columns["archive"].strings))
+            self.assertIs(store.record(0)[1][-2][1], store.record(2)[1][-1][1])
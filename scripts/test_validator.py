@@ -1,9 +1,10 @@
 from copy import deepcopy
+from io import BytesIO
 import unittest
 
 from lxml import etree
 
-from gla_utils import CollexValidator
+from gla_utils import CollexValidator, iter_range_jobs
 
 class TestValidator(unittest.TestCase):
     def setUp(self):
@@ -31,6 +32,68 @@ class TestValidator(unittest.TestCase):
         self.assertEquals("Too many dc:title unique_fields -- can only be one\n", self.validator.validate_object(invalid_item))
         del invalid_item
 
+    def test_invalid_genre_and_discipline_terms_are_caught(self):
+        invalid_item = deepcopy(self.test_item)
+        invalid_item.xpath("collex:genre", namespaces=self.validator.ns)[0].text = "Fan Fiction"
+        invalid_item.xpath("collex:discipline", namespaces=self.validator.ns)[0].text = "Astrology"
+
+        self.assertEquals("Astrology is not a valid discipline termFan Fiction is not a valid genre term",
+                          self.validator.validate_object(invalid_item))
+
+    def test_invalid_if_item_has_no_role(self):
+        invalid_item = deepcopy(self.test_item)
+        invalid_item.remove(invalid_item.xpath("role:CRE", namespaces=self.validator.ns)[0])
+
+        self.assertEquals("At least one role is required", self.validator.validate_object(invalid_item))
+
+    def test_file_validation_matches_tree_validation(self):
+        self.assertEquals(self.validator.validate_rdf(self.tree), self.validator.validate_rdf_file("test_rdf.rdf"))
+
+    def test_file_validation_reports_errors_per_item(self):
+        root = deepcopy(self.tree.getroot())
+        invalid_item = deepcopy(self.test_item)
+        invalid_item.remove(invalid_item.xpath("dc:title", namespaces=self.validator.ns)[0])
+        root.append(invalid_item)
+        root.append(deepcopy(self.test_item))
+
+        errors = list(self.validator.iter_rdf_file_errors(BytesIO(etree.tostring(root))))
+
+        self.assertEquals(["Required field dc:title is missing"], errors)
+
+    def test_parallel_validation_matches_serial_validation(self):
+        root = deepcopy(self.tree.getroot())
+        for i in range(5):
+            invalid_item = deepcopy(self.test_item)
+            invalid_item.remove(invalid_item[i])
+            root.append(invalid_item)
+        tree = etree.ElementTree(root)
+        sources = [BytesIO(etree.tostring(root)), "test_rdf.rdf"]
+        self.assertEquals(6, len(list(iter_range_jobs(BytesIO(etree.tostring(root)), 200))))
+
+        reports = self.validator.validate_rdf_files_parallel(sources, processes=2, chunk_bytes=200)
+
+        self.assertEquals([self.validator.validate_rdf(tree), self.validator.validate_rdf(self.tree)],
+                          [errors for source, errors in reports])
+
+    def test_schema_validation_matches_python_validation(self):
+        ns = self.validator.ns
+        mutations = [lambda item: None,
+                     lambda item: item.remove(item.xpath("dc:title", namespaces=ns)[0]),
+                     lambda item: item.append(deepcopy(item.xpath("dc:title", namespaces=ns)[0])),
+                     lambda item: item.remove(item.xpath("role:CRE", namespaces=ns)[0]),
+                     lambda item: setattr(item.xpath("collex:genre", namespaces=ns)[0], "text", "Fan Fiction"),
+                     lambda item: item.xpath("collex:genre", namespaces=ns)[0].append(etree.Comment("x")),
+                     lambda item: setattr(item.xpath("dc:date", namespaces=ns)[0], "text", "3000")]
+        valid_tree = deepcopy(self.tree)
+        valid_tree.getroot().append(deepcopy(self.test_item))
+
+        for mutate in mutations:
+            # the mutated item sits between two valid ones
+            tree = deepcopy(valid_tree)
+            tree.getroot().append(deepcopy(self.test_item))
+            mutate(tree.getroot()[-2])
+            self.assertEquals(self.validator.validate_rdf(tree), self.validator.validate_rdf(tree, schema=True))
+
     def test_invalid_dc_dates_are_caught(self):
         date_tag = etree.Element("{{{0}}}date".format(self.validator.ns["dc"]))
 